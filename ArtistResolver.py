@@ -0,0 +1,174 @@
+import string
+import sqlite3
+import unicodedata
+from threading import Lock
+
+# punctuation dropped from name keys - "AC/DC" and "ACDC", "Of Mice & Men" and
+# "Of Mice and Men" are the same artist to every provider
+PUNCTUATION = str.maketrans("", "", string.punctuation + "‘’“”–—…")
+
+
+def normalize_name(name: str) -> str:
+
+    """Canonical form of an artist name: accents stripped ("Motörhead" ->
+       "motorhead"), casefolded, "&" spelled out, punctuation dropped and
+       whitespace collapsed. Names that are nothing but punctuation (e.g. "!!!")
+       keep it, rather than all collapsing to ""."""
+
+    decomposed = unicodedata.normalize("NFKD", str(name))
+    name = "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+    name = " ".join(name.replace("&", " and ").split())
+
+    return " ".join(name.translate(PUNCTUATION).split()) or name
+
+
+class ArtistResolver:
+
+    """Maps the many spellings of an artist - names as Spotify, Lastfm and
+       Ticketmaster report them, and Spotify URIs - to one stable artist ID and
+       one canonical name key.
+
+       Every spelling seen is normalized (normalize_name) and stored as an alias
+       of an artist ID; a Spotify URI is an alias too, so a search for "motorhead"
+       and the "Motörhead" it finds resolve to the same artist. The canonical key
+       is the normalized form of the first name an artist was seen under, and the
+       display name the first spelling, used when querying APIs.
+
+       The alias table lives in SQLite (so IDs are stable across runs and shared
+       between processes) and is mirrored in memory, so lookups never touch disk.
+       Safe to use from any number of threads."""
+
+    def __init__(self, db_path: str):
+
+        self.db_path = db_path
+        self.lock = Lock()
+
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        # as in CacheStore - WAL commits only need an fsync at checkpoints
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS artists (
+                                 id INTEGER PRIMARY KEY AUTOINCREMENT,
+                                 key TEXT NOT NULL UNIQUE,
+                                 display_name TEXT NOT NULL)""")
+        self.conn.execute("""CREATE TABLE IF NOT EXISTS aliases (
+                                 alias TEXT PRIMARY KEY,
+                                 artist_id INTEGER NOT NULL REFERENCES artists(id))""")
+
+        # alias -> id, id -> (key, display name)
+        self.aliases = {}
+        self.artists = {}
+        self._reload()
+
+    def _reload(self):
+
+        self.artists = {artist_id: (key, display_name) for artist_id, key, display_name
+                        in self.conn.execute("SELECT id, key, display_name FROM artists")}
+        self.aliases = dict(self.conn.execute("SELECT alias, artist_id FROM aliases"))
+
+    def _artist(self, artist_id: int) -> tuple:
+
+        """(key, display name) of an artist ID - from the database if another process
+           registered it after we last loaded the table."""
+
+        artist = self.artists.get(artist_id)
+        if artist is None:
+            artist = self.conn.execute("SELECT key, display_name FROM artists WHERE id = ?", (artist_id,)).fetchone()
+            self.artists[artist_id] = artist = tuple(artist)
+
+        return artist
+
+    def _add_alias(self, alias: str, artist_id: int):
+
+        # another process may have claimed the alias first - theirs wins
+        self.conn.execute("INSERT OR IGNORE INTO aliases VALUES (?, ?)", (alias, artist_id))
+        self.aliases[alias] = self.conn.execute("SELECT artist_id FROM aliases WHERE alias = ?",
+                                                (alias,)).fetchone()[0]
+
+    def _register(self, artist_id: int, key: str, display_name: str, aliases: list) -> int:
+
+        """Writes aliases of artist_id - registering the artist first (under key and
+           display_name) if artist_id is None - in one transaction, and returns
+           the artist ID."""
+
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            if artist_id is None:
+                self.conn.execute("INSERT OR IGNORE INTO artists (key, display_name) VALUES (?, ?)",
+                                  (key, display_name))
+                artist_id, key, display_name = self.conn.execute(
+                    "SELECT id, key, display_name FROM artists WHERE key = ?", (key,)).fetchone()
+                self.artists[artist_id] = (key, display_name)
+                self._add_alias(key, artist_id)
+                artist_id = self.aliases[key]
+            for alias in aliases:
+                if alias not in self.aliases:
+                    self._add_alias(alias, artist_id)
+            self.conn.execute("COMMIT")
+        except Exception:
+            self.conn.execute("ROLLBACK")
+            raise
+
+        return artist_id
+
+    def resolve(self, name: str=None, uri: str=None) -> int:
+
+        """Artist ID for a name and/or Spotify URI, registering the artist (and
+           any new spelling or URI of a known one) on first sight."""
+
+        if not name and not uri:
+            raise ValueError("ArtistResolver: need a name or a URI to resolve.")
+
+        alias = normalize_name(name) if name else None
+        with self.lock:
+            # a URI is the stronger identity - a name can be shared by two artists
+            artist_id = self.aliases.get(uri) if uri else None
+            if artist_id is None and alias is not None:
+                artist_id = self.aliases.get(alias)
+
+            if artist_id is None and alias is None:
+                # nothing but a URI we haven't seen - nothing to call it by yet
+                return None
+
+            # a new artist and its aliases, or a known one's new spellings, in one commit
+            new_aliases = [a for a in (alias, uri) if a and a not in self.aliases]
+            if artist_id is None or new_aliases:
+                artist_id = self._register(artist_id, alias, str(name), new_aliases)
+
+            return artist_id
+
+    def key(self, name: str=None, uri: str=None) -> str:
+
+        """Canonical name key of an artist - what caches, feature rows and edges are keyed on."""
+
+        artist_id = self.resolve(name, uri)
+        if artist_id is None:
+            return None
+
+        with self.lock:
+            return self._artist(artist_id)[0]
+
+    def display_name(self, key: str) -> str:
+
+        """The spelling an artist was first seen under (e.g. "AC/DC" for "acdc"), for API queries."""
+
+        artist_id = self.aliases.get(normalize_name(key))
+        if artist_id is None:
+            return key
+
+        with self.lock:
+            return self._artist(artist_id)[1]
+
+    def artist_id(self, name: str) -> int:
+
+        """ID of an already-known artist name (or URI), without registering anything."""
+
+        return self.aliases.get(name) or self.aliases.get(normalize_name(name))
+
+    def __len__(self) -> int:
+
+        return len(self.artists)
+
+    def close(self):
+
+        self.conn.close()
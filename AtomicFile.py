@@ -0,0 +1,18 @@
+import os
+from contextlib import contextmanager
+
+
+@contextmanager
+def atomic_path(path: str):
+
+    """Yields a temporary path to write to, then renames it over path, so readers
+       (and other pipeline processes) only ever see the old file or the new one.
+       The temporary name is unique per process, and removed if the write fails."""
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
@@ -0,0 +1,405 @@
+import os
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from threading import Lock
+from typing import List
+
+# how long entries in each cache stay fresh - tour data goes stale fast,
+# discographies and similar artists barely move
+DEFAULT_TTLS = {"spotify_artist_cache": timedelta(weeks=2),
+                "spotify_discog_cache": timedelta(weeks=4),
+                # album pages are revalidated against the album total before reuse
+                "spotify_album_pages": timedelta(weeks=12),
+                "lastfm_cache": timedelta(days=7),
+                "lastfm_similar_cache": timedelta(weeks=4),
+                "ticketmaster_cache": timedelta(hours=6)}
+DEFAULT_TTL = timedelta(days=7)
+# namespaces keyed by artist name - legacy JSON caches keyed them on name.lower(),
+# so their keys are rekeyed (to ArtistResolver keys) when imported
+ARTIST_NAMESPACES = {"spotify_artist_cache", "spotify_discog_cache", "lastfm_cache",
+                     "lastfm_similar_cache", "ticketmaster_cache"}
+# negative entries (failed lookups) expire on their own, shorter clock: an artist
+# a provider doesn't know isn't worth asking about again for a few days, but a
+# timeout or outage should be retried soon
+DEFAULT_NEGATIVE_TTLS = {"not_found": timedelta(days=3),
+                         "transient": timedelta(minutes=15)}
+# per-namespace cap; least recently used entries are evicted past this
+DEFAULT_MAX_ENTRIES = 50000
+# in-memory shards per table - workers only contend when their keys hash together
+N_SHARDS = 16
+# how long a connection waits on another writer (thread or process) before giving up
+BUSY_TIMEOUT_MS = 30000
+
+
+class _Shard:
+
+    def __init__(self):
+
+        self.lock = Lock()
+        # entries already read from / written to this shard during the stage
+        self.entries = {}
+        # entries written since the last flush
+        self.pending = {}
+        # keys read since the last flush - used to keep LRU order on disk
+        self.touched = set()
+
+
+class CacheTable:
+
+    """Dict-like view over one namespace of the cache database. Entries keep the
+       same {"data": ..., "timestamp": ...} shape the JSON caches used, so the
+       fetch functions don't need to know what is behind them.
+
+       Entries with a "negative" key ("not_found" or "transient") record a failed
+       lookup; they hold the placeholder data the stage falls back to, and go
+       stale after the store's negative TTL for that kind rather than the table's.
+
+       Reads go to SQLite one key at a time (and are memoized for the rest of
+       the stage); writes are buffered in memory and only hit disk on flush().
+
+       The in-memory maps are split into shards by key hash, each with its own
+       lock, so the stage's worker threads don't serialize on a single lock, and
+       flush() can run while they are still writing."""
+
+    def __init__(self, store, namespace: str, expiry: timedelta):
+
+        self.store = store
+        self.namespace = namespace
+        self.expiry = expiry
+
+        self._shards = [_Shard() for _ in range(N_SHARDS)]
+
+    def _shard(self, key) -> _Shard:
+
+        return self._shards[hash(key) % N_SHARDS]
+
+    def _is_fresh(self, entry) -> bool:
+
+        expiry = self.store.negative_ttls[entry["negative"]] if entry.get("negative") else self.expiry
+        return entry.get("timestamp", 0) + expiry.total_seconds() > datetime.now().timestamp()
+
+    def get(self, key, default=None):
+
+        shard = self._shard(key)
+        with shard.lock:
+            cached = key in shard.entries
+            entry = shard.entries.get(key)
+
+        if not cached:
+            # read outside the shard lock - a racing read of the same key is harmless
+            entry = self.store._read(self.namespace, key)
+            with shard.lock:
+                entry = shard.entries.setdefault(key, entry)
+
+        if entry is None or not self._is_fresh(entry):
+            return default
+
+        with shard.lock:
+            shard.touched.add(key)
+        return entry
+
+    def __contains__(self, key) -> bool:
+
+        return self.get(key) is not None
+
+    def __getitem__(self, key):
+
+        entry = self.get(key)
+        if entry is None:
+            raise KeyError(key)
+
+        return entry
+
+    def __setitem__(self, key, entry):
+
+        shard = self._shard(key)
+        with shard.lock:
+            shard.entries[key] = entry
+            shard.pending[key] = entry
+
+    def __len__(self) -> int:
+
+        """Number of entries on disk for this namespace (unflushed writes aren't counted)."""
+
+        return self.store._count(self.namespace)
+
+    def flush(self) -> int:
+
+        """Writes all buffered entries to disk in a single transaction and returns
+           the number of entries written."""
+
+        pending, touched = {}, set()
+        for shard in self._shards:
+            with shard.lock:
+                pending.update(shard.pending)
+                touched |= shard.touched - set(shard.pending)
+                shard.pending, shard.touched = {}, set()
+
+        self.store._write(self.namespace, pending)
+        self.store._touch(self.namespace, touched)
+
+        if self.store._count(self.namespace) > self.store.max_entries:
+            self.store.compact(self.namespace)
+
+        return len(pending)
+
+
+class CacheStore:
+
+    """SQLite-backed store for the API caches. Every cache file the pipeline used
+       to keep as a JSON blob becomes a namespace in one database, keyed by
+       (namespace, key), so a stage only reads and writes the rows it touches
+       instead of parsing and rewriting the whole file.
+
+       Existing JSON caches in cache_dir are imported the first time their
+       namespace is opened; the JSON files themselves are left untouched.
+
+       Each namespace has its own TTL (ttls, falling back to default_ttl) and is
+       capped at max_entries rows; negative entries use negative_ttls instead. Expired rows are never returned, and are
+       physically removed by compact(), which also evicts the least recently
+       used rows of any namespace over the cap.
+
+       Every thread gets its own connection and the database runs in WAL mode,
+       so readers never block each other or the writer, and every write is a
+       single IMMEDIATE transaction. That also makes it safe for several
+       pipeline processes to share the same cache directory: SQLite serializes
+       their writes and none of them can clobber another's entries."""
+
+    def __init__(self, cache_dir: str, db_name: str="cache.db", ttls: dict=None,
+                 default_ttl: timedelta=DEFAULT_TTL, max_entries: int=DEFAULT_MAX_ENTRIES, 
+                 negative_ttls: dict=None):
+
+        self.cache_dir = cache_dir
+        self.db_path = os.path.join(cache_dir, db_name)
+
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.default_ttl = default_ttl
+        self.max_entries = max_entries
+        self.negative_ttls = {**DEFAULT_NEGATIVE_TTLS, **(negative_ttls or {})}
+
+        self._local = threading.local()
+        # (thread, connection) for every open connection, so close() can reach the
+        # ones owned by other threads
+        self._connections = []
+        self._connections_lock = Lock()
+
+        with self._transaction() as conn:
+            conn.execute("""CREATE TABLE IF NOT EXISTS entries (
+                                namespace TEXT NOT NULL,
+                                key TEXT NOT NULL,
+                                data TEXT NOT NULL,
+                                timestamp REAL NOT NULL,
+                                last_access REAL NOT NULL DEFAULT 0,
+                                negative TEXT,
+                                PRIMARY KEY (namespace, key)
+                            ) WITHOUT ROWID""")
+            # databases created before LRU eviction have no last_access column
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(entries)")]
+            if "last_access" not in columns:
+                conn.execute("ALTER TABLE entries ADD COLUMN last_access REAL NOT NULL DEFAULT 0")
+            # ... and those created before negative caching have no negative column
+            if "negative" not in columns:
+                conn.execute("ALTER TABLE entries ADD COLUMN negative TEXT")
+            # namespaces whose JSON file has already been imported
+            conn.execute("CREATE TABLE IF NOT EXISTS migrations (namespace TEXT PRIMARY KEY, migrated_at REAL)")
+
+    def _conn(self) -> sqlite3.Connection:
+
+        """This thread's connection, opened on first use."""
+
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None: transactions are managed explicitly in _transaction()
+            conn = sqlite3.connect(self.db_path, timeout=BUSY_TIMEOUT_MS / 1000, 
+                                   isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                # stage thread pools come and go - close what their threads left behind
+                alive = [(threading.current_thread(), conn)]
+                for (thread, other_conn) in self._connections:
+                    if thread.is_alive():
+                        alive.append((thread, other_conn))
+                    else:
+                        other_conn.close()
+                self._connections = alive
+
+        return conn
+
+    @contextmanager
+    def _transaction(self):
+
+        """Write transaction that takes the database's write lock up front, so two
+           writers never deadlock trying to upgrade a read lock."""
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    @staticmethod
+    def namespace_for(cache_file: str) -> str:
+
+        """Maps a legacy cache filename (e.g. lastfm_cache.json) to its namespace."""
+
+        return os.path.splitext(os.path.basename(cache_file))[0]
+
+    def ttl_for(self, namespace: str) -> timedelta:
+
+        return self.ttls.get(namespace, self.default_ttl)
+
+    def table(self, cache_file: str, expiry: timedelta=None, rekey=None) -> CacheTable:
+
+        """Opens the namespace for cache_file. expiry overrides the namespace's TTL;
+           rekey is passed on to migrate_json."""
+
+        namespace = self.namespace_for(cache_file)
+        self.migrate_json(namespace, rekey)
+
+        return CacheTable(self, namespace, expiry or self.ttl_for(namespace))
+
+    def migrate_json(self, namespace: str, rekey=None) -> int:
+
+        """Imports cache_dir/<namespace>.json into the database if it exists and
+           hasn't been imported yet, with every key mapped through rekey if given
+           (where two old keys map to one, the newer entry wins). Returns the
+           number of entries imported."""
+
+        json_path = os.path.join(self.cache_dir, f"{namespace}.json")
+
+        already_migrated = self._conn().execute("SELECT 1 FROM migrations WHERE namespace = ?",
+                                                (namespace,)).fetchone()
+        if already_migrated or not os.path.exists(json_path):
+            return 0
+
+        with open(json_path, "r") as f:
+            legacy_cache = json.load(f)
+
+        # expired entries aren't worth importing
+        oldest = datetime.now().timestamp() - self.ttl_for(namespace).total_seconds()
+        rows = [(namespace, rekey(key) if rekey else key, json.dumps(entry.get("data")),
+                 entry.get("timestamp", 0), entry.get("timestamp", 0))
+                for key, entry in legacy_cache.items() if entry.get("timestamp", 0) > oldest]
+        # newest first, so INSERT OR IGNORE keeps the newest of any keys rekeyed together
+        rows.sort(key=lambda row: -row[3])
+
+        with self._transaction() as conn:
+            # another process may have got here first
+            if conn.execute("SELECT 1 FROM migrations WHERE namespace = ?", (namespace,)).fetchone():
+                return 0
+            # existing rows win - they are at least as new as the JSON snapshot
+            conn.executemany("""INSERT OR IGNORE INTO entries (namespace, key, data, timestamp, last_access) 
+                                VALUES (?, ?, ?, ?, ?)""", rows)
+            conn.execute("INSERT INTO migrations VALUES (?, ?)", (namespace, datetime.now().timestamp()))
+
+        print(f"migrate_json: {len(rows)} entries imported from {json_path}.")
+        return len(rows)
+
+    def _read(self, namespace: str, key: str):
+
+        row = self._conn().execute("SELECT data, timestamp, negative FROM entries WHERE namespace = ? AND key = ?",
+                                   (namespace, key)).fetchone()
+        if row is None:
+            return None
+
+        entry = {"data": json.loads(row[0]), "timestamp": row[1]}
+        if row[2]:
+            entry["negative"] = row[2]
+        return entry
+
+    def _count(self, namespace: str) -> int:
+
+        return self._conn().execute("SELECT COUNT(*) FROM entries WHERE namespace = ?",
+                                    (namespace,)).fetchone()[0]
+
+    def _write(self, namespace: str, entries: dict):
+
+        if not entries:
+            return
+
+        now = datetime.now().timestamp()
+        rows = [(namespace, key, json.dumps(entry.get("data")), entry.get("timestamp", 0), now, entry.get("negative"))
+                for key, entry in entries.items()]
+
+        with self._transaction() as conn:
+            conn.executemany("""INSERT OR REPLACE INTO entries (namespace, key, data, timestamp, last_access, negative) 
+                                VALUES (?, ?, ?, ?, ?, ?)""", rows)
+
+    def _touch(self, namespace: str, keys):
+
+        if not keys:
+            return
+
+        now = datetime.now().timestamp()
+        with self._transaction() as conn:
+            conn.executemany("UPDATE entries SET last_access = ? WHERE namespace = ? AND key = ?",
+                             [(now, namespace, key) for key in keys])
+
+    def namespaces(self) -> List[str]:
+
+        return [row[0] for row in self._conn().execute("SELECT DISTINCT namespace FROM entries")]
+
+    def compact(self, namespace: str=None, vacuum: bool=False) -> int:
+
+        """Deletes expired rows and evicts least recently used rows past max_entries,
+           for one namespace or (by default) all of them. vacuum=True also rewrites
+           the database file so the freed pages are returned to the filesystem.
+           Returns the number of rows removed."""
+
+        namespaces = [namespace] if namespace else self.namespaces()
+        now = datetime.now().timestamp()
+        removed = 0
+
+        with self._transaction() as conn:
+            for ns in namespaces:
+                oldest = now - self.ttl_for(ns).total_seconds()
+                removed += conn.execute("DELETE FROM entries WHERE namespace = ? AND negative IS NULL AND timestamp <= ?",
+                                        (ns, oldest)).rowcount
+                for kind, ttl in self.negative_ttls.items():
+                    removed += conn.execute("DELETE FROM entries WHERE namespace = ? AND negative = ? AND timestamp <= ?",
+                                            (ns, kind, now - ttl.total_seconds())).rowcount
+                # LRU eviction: keep the max_entries most recently used rows
+                removed += conn.execute("""DELETE FROM entries WHERE namespace = ? AND key IN (
+                                               SELECT key FROM entries WHERE namespace = ?
+                                               ORDER BY last_access DESC LIMIT -1 OFFSET ?)""",
+                                        (ns, ns, self.max_entries)).rowcount
+
+        if vacuum:
+            self._conn().execute("VACUUM")
+
+        print(f"compact: {removed} expired or evicted entries removed from {len(namespaces)} caches.")
+        return removed
+
+    def close(self):
+
+        with self._connections_lock:
+            for (_, conn) in self._connections:
+                conn.close()
+            self._connections = []
+        self._local = threading.local()
+
+
+if __name__ == "__main__":
+
+    # one-off migration of every legacy JSON cache in cache/, followed by a
+    # compaction pass to drop whatever has expired since
+    from ArtistResolver import ArtistResolver
+
+    store = CacheStore("cache")
+    resolver = ArtistResolver(os.path.join("cache", "artists.db"))
+    for cache_file in sorted(os.listdir("cache")):
+        if cache_file.endswith(".json"):
+            namespace = CacheStore.namespace_for(cache_file)
+            store.migrate_json(namespace, resolver.key if namespace in ARTIST_NAMESPACES else None)
+    store.compact(vacuum=True)
+    store.close()
+    resolver.close()
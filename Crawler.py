@@ -0,0 +1,91 @@
+import heapq
+from typing import Callable, Dict, List, Tuple
+from ArtistResolver import normalize_name
+
+
+class ArtistCrawler:
+
+    """Best-first crawl of the artist graph outward from already-expanded seed
+       artists (the playlist).
+
+       Every artist discovered is admitted into the graph - meaning its features
+       will be fetched - until node_budget non-seed artists have been admitted.
+       Admitted artists less than max_depth hops from the seeds go on a priority
+       frontier, ordered by the weight of the strongest edge that reached them,
+       and are expanded in batches of batch_size; deeper artists are admitted but
+       never expanded. max_depth=1 reproduces the original one-hop crawl.
+
+       expand(names) -> {name: [(neighbour, weight), ...]} does the actual API
+       work for a batch, so one batch costs the same as one fanned-out stage.
+       Artists are identified by key(name) - pass the one expand's results are
+       keyed on (e.g. ArtistResolver.key)."""
+
+    def __init__(self, expand: Callable[[List[str]], Dict[str, List[Tuple[str, float]]]],
+                 max_depth: int=1, node_budget: int=None, batch_size: int=50, excluded=(),
+                 key: Callable[[str], str]=normalize_name):
+
+        self.expand = expand
+        self.max_depth = max_depth
+        self.node_budget = node_budget
+        self.batch_size = batch_size
+        self.key = key
+
+        # keys that must not be admitted (e.g. already in the feature table)
+        self.seen = set(key(name) for name in excluded)
+        # admitted artist -> depth
+        self.depths = {}
+        # (-priority, insertion order, name, depth)
+        self.frontier = []
+        self.order = 0
+
+    def _budget_left(self) -> bool:
+
+        return self.node_budget is None or len(self.depths) < self.node_budget
+
+    def _admit(self, neighbour_lists: List[Tuple[int, List[Tuple[str, float]]]]):
+
+        """Admits the unseen neighbours of a batch, strongest edges first, at one
+           hop past the artist that reached them."""
+
+        candidates = {}
+        for depth, neighbours in neighbour_lists:
+            for neighbour, weight in neighbours:
+                key = self.key(neighbour)
+                if key in self.seen:
+                    continue
+                # keep the strongest (and, on ties, shallowest) edge to each candidate
+                if key not in candidates or (weight, -depth) > (candidates[key][0], -candidates[key][1]):
+                    candidates[key] = (float(weight), depth)
+
+        for key, (weight, depth) in sorted(candidates.items(), key=lambda item: (-item[1][0], item[1][1])):
+            if not self._budget_left():
+                break
+
+            self.seen.add(key)
+            self.depths[key] = depth
+            if depth < self.max_depth:
+                heapq.heappush(self.frontier, (-weight, self.order, key, depth))
+                self.order += 1
+
+    def crawl(self, seed_neighbours: Dict[str, List[Tuple[str, float]]]) -> Dict[str, int]:
+
+        """Crawls outward from seeds whose neighbours are already known and returns
+           {artist: depth} for every admitted non-seed artist."""
+
+        self.seen |= set(self.key(seed) for seed in seed_neighbours)
+        self._admit([(1, neighbours) for neighbours in seed_neighbours.values()])
+
+        while self.frontier and self._budget_left():
+
+            batch = [heapq.heappop(self.frontier) for _ in range(min(self.batch_size, len(self.frontier)))]
+            batch_depths = {name: depth for (_, _, name, depth) in batch}
+            expanded = self.expand(list(batch_depths))
+
+            expanded = {self.key(name): neighbours for name, neighbours in expanded.items()}
+            self._admit([(batch_depths[name] + 1, neighbours) for name, neighbours in expanded.items()
+                         if name in batch_depths])
+
+            print(f"ArtistCrawler: expanded {len(batch)} artists, {len(self.depths)} admitted, "
+                  f"{len(self.frontier)} on the frontier.")
+
+        return dict(self.depths)
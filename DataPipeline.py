@@ -2,30 +2,72 @@ import pandas as pd
 import numpy as np
 import json
 import spotipy
-import re
 import requests
+import re
 import time
 import os
 import string
+import argparse
 import traceback
 import matplotlib.pyplot as plt
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from collections import Counter
-from threading import Lock
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from spotipy.oauth2 import SpotifyClientCredentials
+from urllib3.util.retry import Retry
 from typing import List 
+from AtomicFile import atomic_path
+from CacheStore import CacheStore, ARTIST_NAMESPACES
+from FetchEngine import FetchEngine, NotFoundError, classify_error, LASTFM_NOT_FOUND_ERROR
+from RateLimiter import make_limiters, parse_retry_after
+from Pipeline import Stage, StageGraph
+from Crawler import ArtistCrawler
+from ArtistResolver import ArtistResolver, normalize_name
+from FeatureStore import FeatureStore
+from EdgeStore import EdgeStore
+from TagVectorizer import TagVectorizer, tag_similarity
+
+# "(Deluxe Edition)", "[10th Anniversary Remaster]", " - Remastered 2015" and the like.
+# A dash only starts a suffix with whitespace on both sides - "Blink-182" is a title
+REISSUE_SUFFIX = re.compile(r"(\s*(\(|\[)|\s+-\s+)[^()\[\]]*\b(deluxe|remaster(ed)?|reissue|expanded|anniversary|edition|version|bonus)\b[^()\[\]]*(\)|\])?\s*$")
 
 class FeatureExtractor: 
 
+    # festival names that slip into lineups as "attractions"
+    FESTIVAL_NAMES = ["aftershock", "louder than life", "rock fest", "rockville", "welcome to rockville", 
+                      "lollapalooza", "sonic temple", "mayhem festival", "coachella", "bonnaroo"]
+
+    # max artists per several-artists request, and tracks per playlist page
+    SPOTIFY_BATCH_SIZE = 50
+    PLAYLIST_PAGE_SIZE = 100
+    ALBUM_PAGE_SIZE = 50
+
+    # API roots - overridable so the stages can be pointed at a local stub server
+    LASTFM_URL = "https://ws.audioscrobbler.com/2.0/"
+    DISCOVERY_URL = "https://app.ticketmaster.com/discovery/v2/events.json"
+
     def __init__(self, spotify_client_id: str, spotify_client_secret: str, 
                  playlist_url: str, lastfm_api_key: str, lastfm_username: str, 
-                 discovery_api_key: str, features_filename: str):
+                 discovery_api_key: str, features_filename: str, 
+                 cache_ttls: dict=None, cache_max_entries: int=50000, 
+                 rate_limits: dict=None, relationships_filename: str="artist_relationships.edges", 
+                 crawl_depth: int=1, crawl_budget: int=None, negative_ttls: dict=None):
         
         auth_manager = SpotifyClientCredentials(client_id=spotify_client_id,
                                                 client_secret=spotify_client_secret)
-        self.SPOTIFY = spotipy.Spotify(auth_manager=auth_manager)
+        # no retries at the HTTP level at all - urllib3 would otherwise sleep through 
+        # any 429 with a Retry-After in the calling thread, whatever status_forcelist 
+        # says, and report exhausted 5xx retries as a header-less 429. Every error 
+        # reaches _spotify_call with its real status instead, where 429s back off 
+        # the shared Spotify limiter for every thread at once
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(max_retries=Retry(total=0, raise_on_status=False, 
+                                                                  respect_retry_after_header=False))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        self.SPOTIFY = spotipy.Spotify(auth_manager=auth_manager, requests_session=session, 
+                                       retries=0, status_retries=0)
 
         self.playlist_url = playlist_url
         self.lastfm_api_key = lastfm_api_key
@@ -34,37 +76,149 @@ class FeatureExtractor:
 
         self.cache_dir = "cache"
         os.makedirs(self.cache_dir, exist_ok=True)
+        # fallback expiry for caches without their own TTL; per-cache TTLs 
+        # (keyed by cache name, e.g. "ticketmaster_cache") override the defaults in CacheStore
         self.cache_expiry = timedelta(days=7)
-        self.cache_lock = Lock()
+        # per-key SQLite store; legacy JSON caches are imported on first use. 
+        # Failed lookups are cached separately, with negative_ttls = 
+        # {"not_found": timedelta, "transient": timedelta} overriding the defaults
+        self.cache_store = CacheStore(self.cache_dir, ttls=cache_ttls, 
+                                      default_ttl=self.cache_expiry, 
+                                      max_entries=cache_max_entries, 
+                                      negative_ttls=negative_ttls)
+
+        # pooled HTTP client shared by the Last.fm and Ticketmaster stages
+        self.http = FetchEngine()
+        # one token bucket per provider ("spotify", "lastfm", "ticketmaster"), shared
+        # by every thread; rate_limits = {provider: (requests_per_second, burst)}
+        self.limiters = make_limiters(rate_limits)
 
         self.features_filename = features_filename
+        self.feature_store = FeatureStore(features_filename)
+        # genre/tag vocabulary next to the features, extended with every new artist's terms
+        self.tag_vectorizer = TagVectorizer(os.path.splitext(features_filename)[0] + ".vocab.json")
+        self.relationships_filename = relationships_filename
+        self.edge_store = EdgeStore(relationships_filename)
+
+        # how far past the playlist to crawl, and the max number of non-playlist 
+        # artists to pull in (None for no limit)
+        self.crawl_depth = crawl_depth
+        self.crawl_budget = crawl_budget
+
+        # long fan-outs flush their caches every flush_every artists; completed stages
+        # are checkpointed so an interrupted run can be resumed
+        self.flush_every = 100
+
+        # "tag" edges: each artist's tag_similarity_k nearest artists by genre/tag overlap 
+        # (TF-IDF cosine of at least tag_min_similarity), ignoring terms on more than 
+        # tag_max_document_frequency of all artists - see TagVectorizer.tag_similarity
+        self.tag_similarity_k = 10
+        self.tag_min_similarity = 0.3
+        self.tag_max_document_frequency = 0.2
+        self.checkpoint_dir = os.path.join(self.cache_dir, "checkpoints")
+
+        # canonical artist keys/IDs for every spelling and URI seen - all caches,
+        # feature rows and edges are keyed on resolver.key(name)
+        self.resolver = ArtistResolver(os.path.join(self.cache_dir, "artists.db"))
+        self.festival_keys = set(normalize_name(name) for name in self.FESTIVAL_NAMES)
+
+    def close(self):
+
+        """Releases the HTTP connection pool and the cache and artist databases."""
+
+        self.http.close()
+        self.cache_store.close()
+        self.resolver.close()
 
-    # TODO
     def _save_cache(self, cache, cache_file):
 
-        cache_path = os.path.join(self.cache_dir, cache_file)
+        """Commits the entries written to a cache table since it was loaded."""
 
-        with open(cache_path, "w") as f:
-            json.dump(cache, f)
+        written = cache.flush()
 
-        print(f"_save_cache: {len(cache)} items saved to cache {cache_file}.")
+        print(f"_save_cache: {written} items saved to cache {cache_file}.")
 
-    # TODO
     def _load_cache(self, cache_file):
 
-        cache_path = os.path.join(self.cache_dir, cache_file)
+        """Returns a dict-like view of the given cache. Entries are read from disk
+           lazily, per key, and entries older than the cache's TTL are treated 
+           as missing. Legacy JSON caches keyed by artist are rekeyed with 
+           resolver.key on import, so their entries are still found."""
 
-        if os.path.exists(cache_path):
+        artist_keyed = self.cache_store.namespace_for(cache_file) in ARTIST_NAMESPACES
+        return self.cache_store.table(cache_file, rekey=self.resolver.key if artist_keyed else None)
 
-            with open(cache_path, "r") as f:
+    def _negative_entry(self, data, e: Exception) -> dict:
 
-                cache = json.load(f)
-                current_time = datetime.now().timestamp()
+        """Cache entry for a failed lookup: the placeholder data the stage falls
+           back to, tagged "not_found" or "transient" so it expires on the shorter
+           negative TTL for that kind."""
 
-                return {k: v for k, v in cache.items() 
-                        if v.get("timestamp", 0) + self.cache_expiry.total_seconds() > current_time}
-        
-        return {}
+        return {"data": data, "timestamp": datetime.now().timestamp(), "negative": classify_error(e)}
+
+    def compact_caches(self, vacuum: bool=True):
+
+        """Removes expired and evicted entries from every cache on disk."""
+
+        return self.cache_store.compact(vacuum=vacuum)
+
+    def _spotify_call(self, method, *args, max_retries: int=4, **kwargs):
+
+        """Calls a spotipy method under the Spotify rate limit, backing off on 429s
+           for as long as Retry-After asks, and retrying server errors and dropped
+           connections with exponential backoff."""
+
+        for attempt in range(max_retries + 1):
+
+            self.limiters["spotify"].acquire()
+            try:
+                return method(*args, **kwargs)
+
+            except spotipy.SpotifyException as e:
+                if attempt == max_retries:
+                    raise
+
+                if e.http_status == 429:
+                    retry_after = parse_retry_after((e.headers or {}).get("Retry-After"), default=2 ** attempt)
+                    print(f"_spotify_call: throttled by Spotify, retrying in {retry_after:.1f}s.")
+                    # held for every thread - they would all be throttled too
+                    self.limiters["spotify"].block_for(retry_after)
+                elif e.http_status in (500, 502, 503, 504):
+                    print(f"_spotify_call: Spotify returned {e.http_status}, retrying in {0.5 * 2 ** attempt:.1f}s.")
+                    time.sleep(0.5 * 2 ** attempt)
+                else:
+                    raise
+
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                if attempt == max_retries:
+                    raise
+                print(f"_spotify_call: {type(e).__name__} talking to Spotify, retrying in {0.5 * 2 ** attempt:.1f}s.")
+                time.sleep(0.5 * 2 ** attempt)
+
+    def _fan_out(self, fn, items, max_workers: int, stage: str, unit: str="artists", caches=()):
+
+        """Submits fn for every item to a thread pool up front and yields (item, result)
+           pairs as they complete. Prints the stage's throughput once all items are done.
+
+           The given cache tables are flushed every flush_every completed items, so a 
+           crash mid-stage only loses the work done since the last flush."""
+
+        start = time.perf_counter()
+        completed = 0
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            future_to_item = {executor.submit(fn, item): item for item in items}
+            for future in as_completed(future_to_item):
+                completed += 1
+                yield future_to_item[future], future.result()
+
+                if completed % self.flush_every == 0:
+                    for cache in caches:
+                        cache.flush()
+
+        elapsed = time.perf_counter() - start
+        print(f"{stage}: {completed} {unit} processed in {elapsed:.2f}s "
+              f"({completed / elapsed if elapsed else 0:.1f} {unit}/s).")
     
     def _get_spotify_features(self, artist_dicts: List[dict]) -> List[dict]:
 
@@ -74,7 +228,9 @@ class FeatureExtractor:
 
         for artist_dict in artist_dicts: 
 
-            features.append({"name": artist_dict.get("name", "").lower(),
+            # by URI where there is one, so e.g. the "Motörhead" a search for 
+            # "motorhead" finds still joins the Lastfm row for "motorhead"
+            features.append({"name": self.resolver.key(artist_dict.get("name", ""), artist_dict.get("uri") or None),
                              "uri": artist_dict.get("uri", ""),
                              "genres": artist_dict.get("genres", []),
                              "albums": artist_dict.get("albums", 0),
@@ -91,12 +247,73 @@ class FeatureExtractor:
         print(f"_get_spotify_features: Spotify features collected for {len(features)} artists.")
         return features
     
+    def _get_discography(self, uri: str, page_cache) -> List[dict]:
+
+        """Returns every album of an artist, one entry per distinct title (the 
+           earliest release of each), paging through artist_albums as needed.
+
+           Pages are cached by artist and offset. The first page is always 
+           requested, since it carries the album total; if the total matches the 
+           cached first page, the remaining pages are served from the cache, 
+           otherwise they are all refetched concurrently."""
+
+        def fetch_page(offset):
+            response = self._spotify_call(self.SPOTIFY.artist_albums, uri, include_groups="album", 
+                                          limit=self.ALBUM_PAGE_SIZE, offset=offset)
+            # only the fields the discography features need
+            page = {"total": response["total"], 
+                    "items": [{"name": album.get("name", ""), 
+                               "release_date": album.get("release_date"), 
+                               "total_tracks": album.get("total_tracks", 0)} 
+                              for album in response["items"]]}
+            page_cache[f"{uri}:{offset}"] = {"data": page, "timestamp": datetime.now().timestamp()}
+            return page
+
+        cached_first_page = page_cache.get(f"{uri}:0")
+        first_page = fetch_page(0)
+        total = first_page["total"]
+        offsets = range(self.ALBUM_PAGE_SIZE, total, self.ALBUM_PAGE_SIZE)
+
+        pages = [first_page]
+        if cached_first_page and cached_first_page["data"]["total"] == total:
+            pages += [page_cache[f"{uri}:{offset}"]["data"] for offset in offsets 
+                      if f"{uri}:{offset}" in page_cache]
+            offsets = [offset for offset in offsets if f"{uri}:{offset}" not in page_cache]
+
+        if offsets:
+            with ThreadPoolExecutor(max_workers=4) as executor:
+                pages += list(executor.map(fetch_page, offsets))
+
+        # collapse deluxe editions, remasters etc. onto the original release
+        albums = {}
+        for album in [album for page in pages for album in page["items"]]:
+            key = self._album_key(album["name"])
+            if key not in albums or (album["release_date"] or "9999") < (albums[key]["release_date"] or "9999"):
+                albums[key] = album
+
+        return list(albums.values())
+
+    @staticmethod
+    def _album_key(album_name: str) -> str:
+
+        """Normalizes an album title so reissues share a key with the original, e.g. 
+           "Sempiternal (Deluxe Edition)" and "Sempiternal - Remastered 2023".
+
+           >>> FeatureExtractor._album_key("Blink-182 - Remastered") == FeatureExtractor._album_key("Blink-182")
+           True
+           """
+
+        key = album_name.lower()
+        key = REISSUE_SUFFIX.sub("", key)
+        return key.translate(str.maketrans('', '', string.punctuation)).strip()
+
     def _generate_discog_features(self, artist_dicts) -> List[dict]:
 
         """Propagates discography features (number of albums, number of tracks, 
            album release dates) for artists."""
 
         spotify_cache = self._load_cache("spotify_discog_cache.json")
+        page_cache = self._load_cache("spotify_album_pages.json")
 
         def fetch_discog(artist_dict): 
 
@@ -104,28 +321,29 @@ class FeatureExtractor:
                 return None
             
             artist_name = artist_dict["name"]
-            cache_key = artist_name.lower()
             uri = artist_dict.get("uri", None)
+            cache_key = self.resolver.key(artist_name, uri or None)
 
             if cache_key in spotify_cache: 
-                return spotify_cache[cache_key]["data"]
+                # only the discography fields come from the cache - the rest of 
+                # artist_dict (e.g. playlist_count) is fresher than the cached copy
+                cached = spotify_cache[cache_key]["data"]
+                return {**artist_dict, **{field: cached.get(field) for field in 
+                                          ["albums", "tracks", "last_album_date", "first_album_date"]}}
             
             try: 
-                time.sleep(0.2)
-                # album info
-                albums = self.SPOTIFY.artist_albums(uri, include_groups="album") if uri else {"total": 0, "items": []}
+                # album info - every page, with deluxe editions/reissues collapsed
+                album_items = self._get_discography(uri, page_cache) if uri else []
                 # number of albums
-                artist_dict["albums"] = albums["total"]
-                album_items = albums["items"]
-                # note that track count only includes tracks from albums, meaning that:
-                    # singles outside albums are not accounted for
-                    # tracks are counted twice if a deluxe version of a album is released
+                artist_dict["albums"] = len(album_items)
+                # note that track count only includes tracks from albums, meaning that
+                # singles outside albums are not accounted for
                 artist_dict["tracks"] = sum(album["total_tracks"] for album in album_items)
-                artist_dict["last_album_date"] = album_items[0]["release_date"] if album_items else None
-                artist_dict["first_album_date"] = album_items[-1]["release_date"] if album_items else None
+                release_dates = [album["release_date"] for album in album_items if album.get("release_date")]
+                artist_dict["last_album_date"] = max(release_dates) if release_dates else None
+                artist_dict["first_album_date"] = min(release_dates) if release_dates else None
                 
-                with self.cache_lock:
-                    spotify_cache[cache_key] = {"data": artist_dict, "timestamp": datetime.now().timestamp()}
+                spotify_cache[cache_key] = {"data": artist_dict, "timestamp": datetime.now().timestamp()}
                 
                 return artist_dict
 
@@ -136,8 +354,7 @@ class FeatureExtractor:
                 artist_dict["last_album_date"] = None
                 artist_dict["first_album_date"] = None
 
-                with self.cache_lock: 
-                    spotify_cache[cache_key] = {"data": artist_dict, "timestamp": datetime.now().timestamp()}
+                spotify_cache[cache_key] = self._negative_entry(artist_dict, e)
                 
                 return artist_dict
             
@@ -145,74 +362,115 @@ class FeatureExtractor:
         # for artist_dict in artist_dicts: 
         #     all_artist_info.append(fetch_discog(artist_dict))
 
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            future_to_artist = {executor.submit(fetch_discog, artist_dict): artist_dict for artist_dict in artist_dicts}
-            for future in as_completed(future_to_artist):
-                result = future.result()
-                if result:
-                    all_artist_info.append(result)
+        for _, result in self._fan_out(fetch_discog, artist_dicts, max_workers=3, 
+                                       stage="_generate_discog_features", 
+                                       caches=[spotify_cache, page_cache]):
+            if result:
+                all_artist_info.append(result)
 
         self._save_cache(spotify_cache, "spotify_discog_cache.json")
+        self._save_cache(page_cache, "spotify_album_pages.json")
         print(f"_generate_discog_features: discography features generated for {len(all_artist_info)} artists.")
         return all_artist_info
     
-    def _get_playlist_artists(self) -> List[dict]: 
+    def _get_playlist_track_artists(self) -> List[dict]:
 
-        """Retrieves artist-level data for each unique artist in the provided 
-           playlist."""    
+        """Walks the playlist and returns the primary artist dict of every track. The
+           first page tells us the total, after which the remaining pages are fetched
+           concurrently (under the shared Spotify rate limit)."""
+
+        def page_artists(response):
+            # considering only the primary artist of each track
+            return [track["track"]["artists"][0] for track in response["items"] if track.get("track")]
+            # return [artist_dict for track in response["items"] 
+            #         for artist_dict in track["track"]["artists"]]
 
         # grab tracks in playlist
-        time.sleep(0.2)
-        response = self.SPOTIFY.playlist_tracks(self.playlist_url, offset=0)
-        # considering only the primary artist of each track
-        artists = [track["track"]["artists"][0] for track in response["items"]]
-        # artists = [artist_dict for track in response["items"] 
-        #            for artist_dict in track["track"]["artists"]]
+        response = self._spotify_call(self.SPOTIFY.playlist_tracks, self.playlist_url, 
+                                      offset=0, limit=self.PLAYLIST_PAGE_SIZE)
+        artists = page_artists(response)
         # total number of tracks on playlist - needed to determine the number 
-        # of loops (max tracks per req. is 100)
+        # of requests (max tracks per req. is 100)
         total = response["total"]
 
-        # for larger playlists, multiple requests need to be made to fetch all tracks
-        for offset in range(100, total + 1, 100): 
-            response = self.SPOTIFY.playlist_tracks(self.playlist_url, offset=offset)
-            artists += [track["track"]["artists"][0] for track in response["items"]]
-            # artists += [artist_dict for track in response["items"] 
-            #             for artist_dict in track["track"]["artists"]]
+        # for larger playlists, the rest of the pages are requested all at once and
+        # their artists collected as each page arrives
+        def fetch_page(offset):
+            return self._spotify_call(self.SPOTIFY.playlist_tracks, self.playlist_url, 
+                                      offset=offset, limit=self.PLAYLIST_PAGE_SIZE)
+
+        offsets = range(self.PLAYLIST_PAGE_SIZE, total, self.PLAYLIST_PAGE_SIZE)
+        for _, response in self._fan_out(fetch_page, offsets, max_workers=8, 
+                                         stage="_get_playlist_track_artists", unit="pages"):
+            artists += page_artists(response)
+
+        return artists
+
+    def _count_playlist_artists(self, track_artists: List[dict]) -> dict:
+
+        """Collapses the per-track artist list into {name: {"uri": uri, "playlist_count": n}}."""
+
+        counts = Counter((self.resolver.key(artist["name"], artist["uri"]), artist["uri"]) for artist in track_artists)
+
+        return {name: {"uri": uri, "playlist_count": count} for (name, uri), count in counts.items()}
+    
+    def _get_playlist_artists(self, playlist_artists: dict=None, 
+                              artist_names: set=None) -> List[dict]: 
+
+        """Retrieves artist-level data for each unique artist in the provided 
+           playlist. playlist_artists ({name: {"uri", "playlist_count"}}) skips 
+           walking the playlist if it is already known; artist_names restricts 
+           the lookup to a subset of the playlist's artists."""    
+
+        if playlist_artists is None:
+            playlist_artists = self._count_playlist_artists(self._get_playlist_track_artists())
         
         # set of unique names and URIs
-        artist_identifiers = set([(artist["name"].lower(), 
-                                   artist["uri"]) for artist in artists])
+        artist_identifiers = set([(name, artist["uri"]) for name, artist in playlist_artists.items()
+                                  if artist_names is None or name in artist_names])
         all_artist_info = []
 
         spotify_cache = self._load_cache("spotify_artist_cache.json")
-        
-        def fetch_artist(uri, name):
 
-            if name in spotify_cache:
+        def with_count(artist_info, name):
+            # the cached count may predate the latest playlist edits
+            return {**artist_info, "playlist_count": playlist_artists[name]["playlist_count"]}
 
-                return spotify_cache[name]["data"]
-            
-            try:
-                artist_info = self.SPOTIFY.artist(uri)
-                artist_count = sum(1 for artist_dict in artists if artist_dict["uri"] == uri)
-                artist_info["playlist_count"] = artist_count
-                spotify_cache[name.lower()] = {"data": artist_info, "timestamp": datetime.now().timestamp()}
+        uncached = []
+        for (name, uri) in artist_identifiers:
+            # a negative entry is a failed search by name - the URI lookup can do better
+            if name in spotify_cache and not spotify_cache[name].get("negative"):
+                all_artist_info.append(with_count(spotify_cache[name]["data"], name))
+            else:
+                uncached.append((name, uri))
 
-                return artist_info
-            
+        def fetch_artists(batch):
+
+            """Hydrates up to SPOTIFY_BATCH_SIZE artists with one several-artists request."""
+
+            try:
+                response = self._spotify_call(self.SPOTIFY.artists, [uri for (_, uri) in batch])
             except Exception as e:
-                print(f"_get_playlist_artists: Error for URI {uri}: {e}")
-                return None
+                print(f"_get_playlist_artists: Error for URIs {[uri for (_, uri) in batch]}: {e}")
+                return []
+
+            artists_info = []
+            # results come back in request order, with None for unknown URIs
+            for (name, uri), artist_info in zip(batch, response.get("artists", [])):
+                if not artist_info:
+                    print(f"_get_playlist_artists: Error for URI {uri}: artist not found")
+                    continue
+                artist_info = with_count(artist_info, name)
+                spotify_cache[name] = {"data": artist_info, "timestamp": datetime.now().timestamp()}
+                artists_info.append(artist_info)
 
-        # for (name, uri) in artist_identifiers: 
-        #     all_artist_info.append(fetch_artist(uri, name))
+            return artists_info
 
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            future_to_artist = {executor.submit(fetch_artist, uri, name): (name, uri) for (name, uri) in artist_identifiers}
-            for future in as_completed(future_to_artist):
-                result = future.result()
-                if result:
-                    all_artist_info.append(result)
+        batches = [uncached[i:i + self.SPOTIFY_BATCH_SIZE] for i in range(0, len(uncached), self.SPOTIFY_BATCH_SIZE)]
+        for _, results in self._fan_out(fetch_artists, batches, max_workers=3, 
+                                        stage="_get_playlist_artists", unit="batches", 
+                                        caches=[spotify_cache]):
+            all_artist_info += results
 
         self._save_cache(spotify_cache, "spotify_artist_cache.json")
         print(f"_get_playlist_artists: information retrieved for {len(artist_identifiers)} artists.")
@@ -231,16 +489,20 @@ class FeatureExtractor:
 
         def fetch_search(artist_name):
 
-            cache_key = artist_name.lower()
+            cache_key = self.resolver.key(artist_name)
             if cache_key in spotify_cache: 
                 return spotify_cache[cache_key]["data"]
 
             try: 
-                time.sleep(0.2)
-                artist_info = self.SPOTIFY.search(q=artist_name, 
-                                                  type="artist").get("artists", {}).get("items", [])[0]
+                items = self._spotify_call(self.SPOTIFY.search, q=self.resolver.display_name(cache_key), 
+                                           type="artist").get("artists", {}).get("items", [])
+                if not items:
+                    raise NotFoundError("no search results")
                 
+                artist_info = items[0]
                 artist_info["playlist_count"] = 0
+                # the name searched for becomes an alias of the artist found
+                self.resolver.resolve(cache_key, artist_info.get("uri") or None)
                 spotify_cache[cache_key] = {"data": artist_info, "timestamp": datetime.now().timestamp()}
 
                 return artist_info
@@ -248,17 +510,18 @@ class FeatureExtractor:
             except Exception as e: 
                 
                 print(f"_get_spotify_artist_by_search: no artist found for query {artist_name}; error {e}.")
-                return {"name": cache_key, "uri": "", "genres": [], 
-                        "popularity": 0, "followers": {"total": 0}, "playlist_count": 0}
+                artist_info = {"name": cache_key, "uri": "", "genres": [], 
+                               "popularity": 0, "followers": {"total": 0}, "playlist_count": 0}
+                spotify_cache[cache_key] = self._negative_entry(artist_info, e)
+                return artist_info
         
         searched_artists = []
 
-        with ThreadPoolExecutor(max_workers=3) as executor:
-            future_to_artist = {executor.submit(fetch_search, name): name for name in artist_names if name}
-            for future in as_completed(future_to_artist):
-                result = future.result()
-                if result:
-                    searched_artists.append(result)
+        for _, result in self._fan_out(fetch_search, [name for name in artist_names if name], 
+                                       max_workers=3, stage="_get_spotify_artist_by_search", 
+                                       caches=[spotify_cache]):
+            if result:
+                searched_artists.append(result)
 
         # for artist_name in artist_names:
            
@@ -277,15 +540,19 @@ class FeatureExtractor:
 
         def fetch_lastfm(artist_name):
 
-            cache_key = artist_name.lower()
+            cache_key = self.resolver.key(artist_name)
             if cache_key in lastfm_cache:
                 return lastfm_cache[cache_key]["data"]
             
-            url = f"https://ws.audioscrobbler.com/2.0/?method=artist.getinfo&artist={artist_name}&username={self.lastfm_username}&api_key={self.lastfm_api_key}&format=json"
+            params = {"method": "artist.getinfo", "artist": self.resolver.display_name(cache_key), "username": self.lastfm_username, 
+                      "api_key": self.lastfm_api_key, "format": "json"}
 
             try: 
-                response = requests.get(url).json()["artist"]
-                artist_info = {"name": artist_name.lower(),
+                response = self.http.get_json(self.LASTFM_URL, params, self.limiters["lastfm"])
+                if response.get("error") == LASTFM_NOT_FOUND_ERROR:
+                    raise NotFoundError(response.get("message"))
+                response = response["artist"]
+                artist_info = {"name": cache_key,
                                "lastfm_listeners": response.get("stats", {}).get("listeners", 0),
                                "lastfm_playcount": response.get("stats", {}).get("playcount", 0),
                                "personal_playcount": response.get("stats", {}).get("userplaycount", 0),
@@ -295,14 +562,14 @@ class FeatureExtractor:
                 return artist_info
 
             except Exception as e: 
-                print(f"Artist {artist_name} not found on lastfm.")
-                artist_info = {"name": artist_name.lower(), 
+                print(f"Artist {artist_name} not found on lastfm; {e}.")
+                artist_info = {"name": cache_key, 
                                "lastfm_listeners": 0, 
                                "lastfm_playcount": 0, 
                                "personal_playcount": 0, 
                                "lastfm_tags": [], 
                                "summary": ""}
-                lastfm_cache[cache_key] = {"data": artist_info, "timestamp": datetime.now().timestamp()}
+                lastfm_cache[cache_key] = self._negative_entry(artist_info, e)
                 return artist_info
         
         artists_info = []
@@ -310,12 +577,11 @@ class FeatureExtractor:
         # for artist_name in artist_names: 
         #     artists_info.append(fetch_lastfm(artist_name))
 
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            future_to_artist = {executor.submit(fetch_lastfm, name): name for name in artist_names}
-            for future in as_completed(future_to_artist):
-                result = future.result()
-                if result:
-                    artists_info.append(result)
+        # workers only wait on the shared connection pool, which caps concurrency per host
+        for _, result in self._fan_out(fetch_lastfm, artist_names, max_workers=16, 
+                                       stage="_get_lastfm_features", caches=[lastfm_cache]):
+            if result:
+                artists_info.append(result)
 
         self._save_cache(lastfm_cache, "lastfm_cache.json")
 
@@ -340,37 +606,37 @@ class FeatureExtractor:
 
         def fetch_similar(artist_name):
 
-            cache_key = artist_name.lower()
+            cache_key = self.resolver.key(artist_name)
             if cache_key in lastfm_cache: 
                 return lastfm_cache[cache_key]["data"]
             
-            artist_name_formatted = "+".join(artist_name.split()).lower()
             # set limit if needed
-            url = f"https://ws.audioscrobbler.com/2.0/?method=artist.getsimilar&artist={artist_name_formatted}&api_key={self.lastfm_api_key}&format=json"
+            params = {"method": "artist.getsimilar", "artist": self.resolver.display_name(cache_key), 
+                      "api_key": self.lastfm_api_key, "format": "json"}
 
             try: 
-                response = requests.get(url).json().get("similarartists", {}).get("artist", [])
+                response = self.http.get_json(self.LASTFM_URL, params, self.limiters["lastfm"])
+                if response.get("error") == LASTFM_NOT_FOUND_ERROR:
+                    raise NotFoundError(response.get("message"))
+                response = response.get("similarartists", {}).get("artist", [])
                 # tuples of (artist, similarity score)
-                similar_artists = [(artist["name"].lower(), artist["match"]) for artist in response]
+                similar_artists = [(self.resolver.key(artist["name"]), artist["match"]) for artist in response]
                 lastfm_cache[cache_key] = {"data": similar_artists, "timestamp": datetime.now().timestamp()}
                 return similar_artists
             
             except Exception as e: 
                 print(f"_get_similar_artists: Error fetching similar artists for artist {artist_name}: {e}")
-                lastfm_cache[cache_key] = {"data": [], "timestamp": datetime.now().timestamp()}
+                lastfm_cache[cache_key] = self._negative_entry([], e)
                 return []
 
         similar_artists = {}
         # for artist_name in artist_names: 
         #     similar_artists[artist_name] = fetch_similar(artist_name)
 
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            for name in artist_names:
-                future_to_artist = {executor.submit(fetch_similar, name)}
-                for future in as_completed(future_to_artist):
-                    result = future.result()
-                    if result:
-                        similar_artists[name] = result
+        for name, result in self._fan_out(fetch_similar, artist_names, max_workers=16, 
+                                          stage="_get_similar_artists", caches=[lastfm_cache]):
+            if result:
+                similar_artists[name] = result
         
         self._save_cache(lastfm_cache, "lastfm_similar_cache.json")
         print(f"Similar artists retrieved for {len(similar_artists)} artists.")
@@ -387,15 +653,15 @@ class FeatureExtractor:
 
         def fetch_events(artist_name):
 
-            cache_key = artist_name.lower()
+            cache_key = self.resolver.key(artist_name)
             if cache_key in ticketmaster_cache: 
                 return ticketmaster_cache[cache_key]["data"]
             
-            artist_name_formatted = "+".join(artist_name.split()).lower()
-            url = f"https://app.ticketmaster.com/discovery/v2/events.json?apikey={self.discovery_api_key}&classificationName=music&keyword={artist_name_formatted}&sort=date,name,asc&size=20"
+            params = {"apikey": self.discovery_api_key, "classificationName": "music", 
+                      "keyword": self.resolver.display_name(cache_key), "sort": "date,name,asc", "size": 20}
             
             try: 
-                response = requests.get(url).json()
+                response = self.http.get_json(self.DISCOVERY_URL, params, self.limiters["ticketmaster"])
                 events = response.get("_embedded", {}).get("events", [])
                 events_compressed = [
                 {
@@ -403,14 +669,14 @@ class FeatureExtractor:
                     "dates": event.get("dates", {}),
                     "classifications": event.get("classifications", []),
                     "attractions": [
-                        {"name": attr.get("name", "").lower(), 
+                        {"name": self.resolver.key(attr["name"]), 
                          "type": attr.get("type", "")}
                         for attr in event.get("_embedded", {}).get("attractions", [])
                         if attr.get("type", "") == "attraction" and attr.get("name") != None
                     ]
                 } for event in events
-                if artist_name.lower() in [attr.get("name", "").lower()
-                                   for attr in event.get("_embedded", {}).get("attractions", [])]]
+                if cache_key in [self.resolver.key(attr["name"]) 
+                                 for attr in event.get("_embedded", {}).get("attractions", []) if attr.get("name")]]
                 
                 # group events with the same name together to avoid iterating repetitively
                 event_groups = {}
@@ -426,20 +692,19 @@ class FeatureExtractor:
             
             except Exception as e: 
                 print(f"_get_artist_events: Error fetching events for artist {artist_name}: {e}; {traceback.format_exc()}.")
-                ticketmaster_cache[cache_key] = {"data": {}, "timestamp": datetime.now().timestamp()}
+                # an artist with no upcoming events is a normal, positive result - 
+                # getting here means the request itself failed
+                ticketmaster_cache[cache_key] = self._negative_entry({}, e)
                 return {}
         
         artist_events = {}
         # for artist_name in artist_names: 
         #     artist_events[artist_name.lower()] = fetch_events(artist_name)
 
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            for name in artist_names:
-                future_to_artist = {executor.submit(fetch_events, name)}
-                for future in as_completed(future_to_artist):
-                    result = future.result()
-                    if result:
-                        artist_events[name.lower()] = result
+        for name, result in self._fan_out(fetch_events, artist_names, max_workers=16, 
+                                          stage="_get_artist_events", caches=[ticketmaster_cache]):
+            if result:
+                artist_events[self.resolver.key(name)] = result
 
         print(f"_get_artist_events: Events fetched for {len(artist_events)} artists.")
         self._save_cache(ticketmaster_cache, "ticketmaster_cache.json")
@@ -481,6 +746,7 @@ class FeatureExtractor:
 
         def fetch_coperformers(artist_name, events):
 
+            # artist_event_groups is keyed on resolver keys already
             tour_coperformers = []
             festival_coperformers = []
             tour_status = "not_touring" 
@@ -494,9 +760,9 @@ class FeatureExtractor:
                 event_is_tour = self.__is_tour(event)
 
                 if get_coperformers: 
-                    event_attractions = [attr["name"].lower() for attr in event.get("attractions", [])]
+                    event_attractions = [self.resolver.key(attr["name"]) for attr in event.get("attractions", [])]
 
-                    if artist_name.lower() not in event_attractions: 
+                    if artist_name not in event_attractions: 
                         print(f"Skipping events for artist name {artist_name} with attractions {event_attractions}")
                         continue
 
@@ -517,12 +783,12 @@ class FeatureExtractor:
                     tour_status = "on_tour"
 
             # remove the artist from their own coperformer groups
-            tour_coperformers = set(tour_coperformers) - set([artist_name.lower()])
+            tour_coperformers = set(tour_coperformers) - set([artist_name])
             festival_coperformers = Counter(festival_coperformers)
-            festival_coperformers.pop(artist_name.lower(), None)
+            festival_coperformers.pop(artist_name, None)
 
             artist_tour_data = {
-                "name": artist_name.lower(),
+                "name": artist_name,
                 "tour_status": tour_status,
                 "tour_date": tour_date,
                 "tour_coperformers": tour_coperformers,
@@ -538,50 +804,78 @@ class FeatureExtractor:
 
         return all_artist_tour_info
     
-    def get_all_artist_features(self):
-
-        # start with playlist artists - these are Spotify features
-        playlist_spotify_features = self._get_playlist_artists()
-        # lowercase names of playlist artists
-        playlist_artist_names = [artist.get("name", "") for artist in playlist_spotify_features]
-        # lastfm features
-        playlist_lastfm_features = self._get_lastfm_features(playlist_artist_names)
-        # tour data with coperformers
-        playlist_tour_data = self._get_artist_coperformers(playlist_artist_names, get_coperformers=True)
-        # get similar artists - note for each artist these are tuples of (name, score)
-        similar_artists = self._get_similar_artists(playlist_artist_names)
-
-        # new artists linked to playlist artists
-        all_artists = set([tup[0].lower() for artist, tuples in similar_artists.items() 
-                           for tup in tuples] + 
-                          [co.lower() for coperformers in playlist_tour_data 
-                           for co in coperformers["tour_coperformers"]] + 
-                          [co.lower() for coperformers in playlist_tour_data 
-                           for co in coperformers["festival_coperformers"]])
+    def _get_playlist_snapshot_id(self) -> str:
+
+        """Spotify changes a playlist's snapshot_id whenever its tracks change."""
+
+        return self._spotify_call(self.SPOTIFY.playlist, self.playlist_url, fields="snapshot_id")["snapshot_id"]
+
+    def _load_playlist_snapshot(self):
+
+        snapshot_path = os.path.join(self.cache_dir, "playlist_snapshot.json")
+        if not os.path.exists(snapshot_path):
+            return None
+
+        with open(snapshot_path, "r") as f:
+            return json.load(f)
+
+    def _save_playlist_snapshot(self, snapshot_id: str, playlist_artists: dict):
+
+        """Records the playlist state a run was built from, so the next incremental
+           refresh can diff against it."""
+
+        with atomic_path(os.path.join(self.cache_dir, "playlist_snapshot.json")) as tmp_path, open(tmp_path, "w") as f:
+            json.dump({"snapshot_id": snapshot_id, 
+                       "timestamp": datetime.now().timestamp(), 
+                       "artists": playlist_artists}, f)
+
+    def _expired_artists(self, artist_names, cache_files: List[str]) -> set:
+
+        """Names with no fresh entry in at least one of the given caches."""
+
+        caches = [self._load_cache(cache_file) for cache_file in cache_files]
+
+        return set(name for name in artist_names 
+                   if any(self.resolver.key(name) not in cache for cache in caches))
+
+    def _neighbours(self, similar_artists: dict, tour_data: List[dict]) -> dict:
+
+        """{artist: [(neighbour, weight), ...]} for every artist connected to the given
+           artists through Lastfm similarity or a shared tour/festival lineup. Weights 
+           are on the similarity scale: 1.0 for touring together, and festival 
+           lineups count for more the more festivals are shared."""
+
+        neighbours = {}
+        for artist, tuples in similar_artists.items():
+            neighbours.setdefault(artist, []).extend((self.resolver.key(name), float(score)) for (name, score) in tuples)
+
+        for coperformers in tour_data:
+            artist_neighbours = neighbours.setdefault(coperformers["name"], [])
+            artist_neighbours.extend((self.resolver.key(co), 1.0) for co in coperformers["tour_coperformers"])
+            artist_neighbours.extend((self.resolver.key(co), min(1.0, cnt / 2)) 
+                                     for co, cnt in coperformers["festival_coperformers"].items())
+        
         # remove festival names - some were accidentally included despite my filtering
-        festival_names = ["aftershock", "louder than life", "rock fest", "rockville", "welcome to rockville", 
-                    "lollapalooza", "sonic temple", "mayhem festival", "coachella", "bonnaroo"]
-        all_artists = all_artists - set(festival_names)
-        nonplaylist_artist_names = all_artists - set(playlist_artist_names)
-        # get features of new artists - spotify
-        nonplaylist_spotify_features = self._get_spotify_artist_by_search(nonplaylist_artist_names)
-        # lastfm
-        nonplaylist_lastfm_features = self._get_lastfm_features(nonplaylist_artist_names)
-        # tour data - not including coperformers
-        nonplaylist_tour_data = self._get_artist_coperformers(nonplaylist_artist_names, get_coperformers=False)
-
-        # consolidate all features across all artists
-        playlist_all_features = pd.DataFrame(playlist_spotify_features).merge(pd.DataFrame(playlist_lastfm_features),
-                                                                              how="left", on="name")
-        playlist_all_features = playlist_all_features.merge(pd.DataFrame(playlist_tour_data), 
-                                                            how="left", on="name")
-
-        nonplaylist_all_features = pd.DataFrame(nonplaylist_spotify_features).merge(pd.DataFrame(nonplaylist_lastfm_features), 
-                                                                                    how="left", on="name")
-        nonplaylist_all_features = nonplaylist_all_features.merge(pd.DataFrame(nonplaylist_tour_data), 
-                                                                  how="left", on="name")
+        return {artist: [(name, weight) for (name, weight) in artist_neighbours if name not in self.festival_keys]
+                for artist, artist_neighbours in neighbours.items()}
+
+    def _merge_artist_features(self, spotify_features: List[dict], lastfm_features: List[dict], 
+                               tour_data: List[dict]) -> pd.DataFrame:
+
+        """Joins the Spotify, Lastfm and tour features of a group of artists on name."""
+
+        # an empty stage result still needs a name column to merge on
+        def frame(records):
+            return pd.DataFrame(records) if records else pd.DataFrame(columns=["name"])
+
+        all_features = frame(spotify_features).merge(frame(lastfm_features), how="left", on="name")
+        return all_features.merge(frame(tour_data), how="left", on="name")
+
+    def _build_relations(self, similar_artists: dict, tour_data: List[dict]) -> List[dict]:
+
+        """Turns similar artists and coperformers into edge dicts."""
+
         # TODO: only add to relations if present in all features
-        # TODO: there is still some issue w lowercasing - as seen in viz.
         # artist relations
             # lastfm similarity
         relations = []
@@ -595,7 +889,7 @@ class FeatureExtractor:
                     "type": "similarity",
                     "weight": float(sim_score)})
         # coperformers
-        for coperformer_dict in playlist_tour_data:
+        for coperformer_dict in tour_data:
 
             origin = coperformer_dict["name"]
             tour_coperformers = coperformer_dict["tour_coperformers"]
@@ -617,23 +911,259 @@ class FeatureExtractor:
                     "type": "festival", 
                     "weight": cnt
                 })
-        
-        with open("artist_relationships.json", "w") as f:
-            json.dump(relations, f, indent=2)
 
-        print(f"get_all_artist_features: {len(relations)} artist relationships saved to artist_relationships.json.")
+        return relations
+
+    def _build_tag_relations(self, features: pd.DataFrame, tag_matrix) -> List[dict]:
+
+        """Similarity edges from genre/tag overlap alone - available for every artist
+           with genres or tags, not just the ones Lastfm getsimilar was called for, 
+           and costing no API calls."""
+
+        rows, columns, similarities = tag_similarity(tag_matrix, self.tag_similarity_k, self.tag_min_similarity, 
+                                                     self.tag_max_document_frequency)
+        names = features["name"].to_numpy()
 
-        ALL_FEATURES = pd.concat([playlist_all_features, nonplaylist_all_features])
+        return [{"origin": origin, "target": target, "type": "tag", "weight": float(similarity)} 
+                for origin, target, similarity in zip(names[rows], names[columns], similarities)]
+
+    def _write_outputs(self, feature_frames: List[pd.DataFrame], relations: List[dict]) -> pd.DataFrame:
+
+        """Writes the edge list and the combined feature table. Earlier frames win 
+           when an artist appears in more than one. Tag edges are recomputed from 
+           the combined table every time, replacing any in relations."""
+
+        ALL_FEATURES = pd.concat(feature_frames)
         ALL_FEATURES = ALL_FEATURES.drop_duplicates(subset=["name"])
         ALL_FEATURES = ALL_FEATURES.dropna(subset=["name", "popularity", "albums", "lastfm_listeners", "tour_status"])
+        ALL_FEATURES["artist_id"] = ALL_FEATURES["name"].map(self.resolver.artist_id)
+
+        known_terms = len(self.tag_vectorizer)
+        tag_matrix = self.tag_vectorizer.fit_transform(ALL_FEATURES["genres"], ALL_FEATURES["lastfm_tags"])
+        if len(self.tag_vectorizer) > known_terms or not os.path.exists(self.tag_vectorizer.path):
+            self.tag_vectorizer.save()
+
+        tag_relations = self._build_tag_relations(ALL_FEATURES, tag_matrix)
+        relations = [relation for relation in relations if relation["type"] != "tag"] + tag_relations
+        print(f"get_all_artist_features: {len(tag_relations)} tag similarity relationships added.")
+
+        # node table + per-relation CSR arrays - see EdgeStore
+        self.edge_store.write(relations)
+
+        print(f"get_all_artist_features: {len(relations)} artist relationships saved to {self.relationships_filename}.")
         
-        ALL_FEATURES.to_csv(self.features_filename, index=False)
+        # Parquet with native list columns - see FeatureStore.SCHEMA
+        self.feature_store.write(ALL_FEATURES)
 
         print(f"get_all_artist_features: All features written to {self.features_filename}.")
         return ALL_FEATURES
+    
+    def _artist_stages(self) -> List[Stage]:
+
+        """Stages shared by full and incremental runs: given the playlist artists to 
+           process (playlist_names), fetch their features, similar artists and 
+           coperformers, crawl out to the artists linked to them (minus expansion_excluded), 
+           fetch those artists' features too, plus any stale_nonplaylist artists."""
+
+        def crawl(similar_artists, playlist_tour_data, expansion_excluded, stale_nonplaylist):
+            # artists linked to playlist artists, and - past the first hop - to those 
+            # artists in turn, up to crawl_depth hops and crawl_budget new artists
+            crawl_similar_artists, crawl_tour_data = {}, []
+
+            def expand(artist_names):
+                similar = self._get_similar_artists(artist_names)
+                tour_data = self._get_artist_coperformers(artist_names, get_coperformers=True)
+                crawl_similar_artists.update(similar)
+                crawl_tour_data.extend(tour_data)
+                return self._neighbours(similar, tour_data)
+
+            crawler = ArtistCrawler(expand, max_depth=self.crawl_depth, node_budget=self.crawl_budget, 
+                                    excluded=expansion_excluded, key=self.resolver.key)
+            new_artists = set(crawler.crawl(self._neighbours(similar_artists, playlist_tour_data)))
+
+            return {"new_artists": new_artists, "nonplaylist_names": new_artists | stale_nonplaylist, 
+                    "crawl_similar_artists": crawl_similar_artists, "crawl_tour_data": crawl_tour_data}
+
+        def merge(playlist_spotify_features, playlist_lastfm_features, playlist_tour_data, 
+                  nonplaylist_spotify_features, nonplaylist_lastfm_features, nonplaylist_tour_data):
+            # consolidate all features across all artists
+            return {"playlist_all_features": self._merge_artist_features(playlist_spotify_features, playlist_lastfm_features, 
+                                                                         playlist_tour_data), 
+                    "nonplaylist_all_features": self._merge_artist_features(nonplaylist_spotify_features, nonplaylist_lastfm_features, 
+                                                                            nonplaylist_tour_data)}
+
+        return [
+            # playlist artists - Spotify features
+            Stage("playlist_spotify", 
+                  lambda playlist_artists, playlist_names: {"playlist_spotify_features": self._get_playlist_artists(playlist_artists, playlist_names)}, 
+                  inputs=["playlist_artists", "playlist_names"], outputs=["playlist_spotify_features"]), 
+            # lastfm features
+            Stage("playlist_lastfm", 
+                  lambda playlist_names: {"playlist_lastfm_features": self._get_lastfm_features(playlist_names)}, 
+                  inputs=["playlist_names"], outputs=["playlist_lastfm_features"]), 
+            # tour data with coperformers
+            Stage("playlist_tour", 
+                  lambda playlist_names: {"playlist_tour_data": self._get_artist_coperformers(playlist_names, get_coperformers=True)}, 
+                  inputs=["playlist_names"], outputs=["playlist_tour_data"]), 
+            # similar artists - note for each artist these are tuples of (name, score)
+            Stage("similar", 
+                  lambda playlist_names: {"similar_artists": self._get_similar_artists(playlist_names)}, 
+                  inputs=["playlist_names"], outputs=["similar_artists"]), 
+            Stage("crawl", crawl, 
+                  inputs=["similar_artists", "playlist_tour_data", "expansion_excluded", "stale_nonplaylist"], 
+                  outputs=["new_artists", "nonplaylist_names", "crawl_similar_artists", "crawl_tour_data"]), 
+            # features of non-playlist artists - spotify, lastfm, and tour data (not including coperformers)
+            Stage("nonplaylist_spotify", 
+                  lambda nonplaylist_names: {"nonplaylist_spotify_features": self._get_spotify_artist_by_search(nonplaylist_names)}, 
+                  inputs=["nonplaylist_names"], outputs=["nonplaylist_spotify_features"]), 
+            Stage("nonplaylist_lastfm", 
+                  lambda nonplaylist_names: {"nonplaylist_lastfm_features": self._get_lastfm_features(nonplaylist_names)}, 
+                  inputs=["nonplaylist_names"], outputs=["nonplaylist_lastfm_features"]), 
+            Stage("nonplaylist_tour", 
+                  lambda nonplaylist_names: {"nonplaylist_tour_data": self._get_artist_coperformers(nonplaylist_names, get_coperformers=False)}, 
+                  inputs=["nonplaylist_names"], outputs=["nonplaylist_tour_data"]), 
+            Stage("merge", merge, 
+                  inputs=["playlist_spotify_features", "playlist_lastfm_features", "playlist_tour_data", 
+                          "nonplaylist_spotify_features", "nonplaylist_lastfm_features", "nonplaylist_tour_data"], 
+                  outputs=["playlist_all_features", "nonplaylist_all_features"])
+        ]
+
+    def get_all_artist_features(self, incremental: bool=False, resume: bool=False):
+
+        """Crawls the playlist, its artists' similar artists and coperformers, and
+           writes the feature table and edge list. With incremental=True, existing 
+           outputs are refreshed in place instead (see _refresh_artist_features).
+
+           The work is a StageGraph, so independent stages (e.g. the Spotify, Lastfm, 
+           tour and similar-artist lookups for playlist artists) run concurrently. 
+           Completed stages are checkpointed under cache/checkpoints until the outputs 
+           are written; resume=True continues an interrupted run from there (artists 
+           already fetched within an unfinished stage are served from the cache)."""
+
+        if incremental and os.path.exists(self.features_filename) and os.path.exists(self.relationships_filename):
+            return self._refresh_artist_features(resume=resume)
+
+        def walk_playlist():
+            playlist_artists = self._count_playlist_artists(self._get_playlist_track_artists())
+            # lowercase names of playlist artists
+            playlist_names = set(playlist_artists)
+            return {"playlist_artists": playlist_artists, "playlist_names": playlist_names, 
+                    "expansion_excluded": playlist_names, "stale_nonplaylist": set()}
+
+        graph = StageGraph([Stage("snapshot_id", lambda: {"snapshot_id": self._get_playlist_snapshot_id()}, 
+                                  outputs=["snapshot_id"]), 
+                            Stage("playlist", walk_playlist, 
+                                  outputs=["playlist_artists", "playlist_names", "expansion_excluded", "stale_nonplaylist"])] + 
+                           self._artist_stages(), 
+                           checkpoint_dir=os.path.join(self.checkpoint_dir, "full"))
+        results = graph.run(resume=resume)
+
+        relations = self._build_relations({**results["similar_artists"], **results["crawl_similar_artists"]}, 
+                                          results["playlist_tour_data"] + results["crawl_tour_data"])
+        ALL_FEATURES = self._write_outputs([results["playlist_all_features"], results["nonplaylist_all_features"]], relations)
+        self._save_playlist_snapshot(results["snapshot_id"], results["playlist_artists"])
+        graph.clear_checkpoints()
+        return ALL_FEATURES
+
+    def _refresh_artist_features(self, resume: bool=False) -> pd.DataFrame:
+
+        """Incremental refresh of the existing feature table and edge list. The 
+           playlist is diffed against the snapshot saved by the last run (and not 
+           walked at all if Spotify reports it unchanged); only artists that are 
+           new, or whose cached data has expired, are run through the stages, and 
+           their rows and outgoing edges replace the old ones. Artists removed from
+           the playlist keep their row but lose the edges they contributed as 
+           playlist artists."""
+
+        features = self.feature_store.read()
+        relations = self.edge_store.read().to_records()
+        snapshot = self._load_playlist_snapshot()
+
+        # outputs written before the resolver existed are keyed on plain lowercase 
+        # names - rekeying is a no-op for everything else
+        features["name"] = features["name"].map(self.resolver.key)
+        features = features.drop_duplicates(subset=["name"])
+        for relation in relations:
+            relation["origin"], relation["target"] = self.resolver.key(relation["origin"]), self.resolver.key(relation["target"])
+        if snapshot:
+            snapshot["artists"] = {self.resolver.key(name, artist["uri"]): artist for name, artist in snapshot["artists"].items()}
+        known_artists = set(features["name"])
+
+        def diff_playlist(snapshot_id):
+
+            if snapshot and snapshot["snapshot_id"] == snapshot_id:
+                # playlist unchanged since the last run - no need to walk its tracks
+                playlist_artists = snapshot["artists"]
+            else:
+                playlist_artists = self._count_playlist_artists(self._get_playlist_track_artists())
+
+            if snapshot:
+                previous_playlist = set(snapshot["artists"])
+            else:
+                # outputs written before snapshots existed
+                previous_playlist = set(features.loc[features["playlist_count"] > 0, "name"])
+
+            current_playlist = set(playlist_artists)
+
+            # playlist artists are expanded, so their similar artists can expire too, and their
+            # tours (hours-long TTL) are what the tour edges are built from
+            artist_caches = ["spotify_artist_cache.json", "spotify_discog_cache.json", "lastfm_cache.json"]
+            refresh_playlist = ((current_playlist - previous_playlist) | 
+                                self._expired_artists(current_playlist, artist_caches + 
+                                                      ["lastfm_similar_cache.json", "ticketmaster_cache.json"]))
+            
+            # existing non-playlist artists whose data has expired - tour data is left out,
+            # or every run more than a few hours after the last would refresh them all; it
+            # is refetched whenever one of their other caches expires
+            stale_nonplaylist = self._expired_artists(known_artists - current_playlist, artist_caches)
+
+            return {"playlist_artists": playlist_artists, "playlist_names": refresh_playlist, 
+                    "removed_playlist": previous_playlist - current_playlist, 
+                    "expansion_excluded": known_artists | current_playlist, 
+                    "stale_nonplaylist": stale_nonplaylist}
+
+        graph = StageGraph([Stage("snapshot_id", lambda: {"snapshot_id": self._get_playlist_snapshot_id()}, 
+                                  outputs=["snapshot_id"]), 
+                            Stage("diff_playlist", diff_playlist, inputs=["snapshot_id"], 
+                                  outputs=["playlist_artists", "playlist_names", "removed_playlist", 
+                                           "expansion_excluded", "stale_nonplaylist"])] + 
+                           self._artist_stages(), 
+                           checkpoint_dir=os.path.join(self.checkpoint_dir, "incremental"))
+        results = graph.run(resume=resume)
+        refresh_playlist, removed_playlist = results["playlist_names"], results["removed_playlist"]
+        playlist_artists = results["playlist_artists"]
+        
+        # edges contributed by refreshed or removed playlist artists are rebuilt from scratch
+        stale_origins = refresh_playlist | removed_playlist
+        relations = ([relation for relation in relations if relation["origin"] not in stale_origins] + 
+                     self._build_relations({**results["similar_artists"], **results["crawl_similar_artists"]}, 
+                                           results["playlist_tour_data"] + results["crawl_tour_data"]))
+        
+        # refreshed rows first, so they win over the rows they replace
+        ALL_FEATURES = pd.concat([results["playlist_all_features"], results["nonplaylist_all_features"], features])
+        ALL_FEATURES["playlist_count"] = ALL_FEATURES["name"].map(
+            {name: artist["playlist_count"] for name, artist in playlist_artists.items()}).fillna(0).astype(int)
+
+        print(f"_refresh_artist_features: {len(refresh_playlist)} playlist and {len(results['nonplaylist_names'])} other artists "
+              f"refreshed ({len(results['new_artists'])} new, {len(removed_playlist)} removed from playlist).")
+        ALL_FEATURES = self._write_outputs([ALL_FEATURES], relations)
+        self._save_playlist_snapshot(results["snapshot_id"], playlist_artists)
+        graph.clear_checkpoints()
+        return ALL_FEATURES
 
 if __name__ == "__main__":
 
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--incremental", action="store_true", 
+                        help="refresh the existing outputs, fetching only new or expired artists")
+    parser.add_argument("--resume", action="store_true", 
+                        help="continue an interrupted run from its last completed stage")
+    parser.add_argument("--depth", type=int, default=1, 
+                        help="number of hops to crawl out from the playlist")
+    parser.add_argument("--budget", type=int, default=None, 
+                        help="max number of non-playlist artists to pull in")
+    args = parser.parse_args()
+
     # load all API keys
     load_dotenv()
 
@@ -643,6 +1173,9 @@ if __name__ == "__main__":
                                  lastfm_api_key=os.environ.get("LASTFM_API_KEY"), 
                                  lastfm_username="jasminexx18", 
                                  discovery_api_key=os.environ.get("TM_API_KEY"), 
-                                 features_filename="ALL_FEATURES_HARDNHEAVY.csv")
+                                 features_filename="ALL_FEATURES_HARDNHEAVY.parquet", 
+                                 crawl_depth=args.depth, 
+                                 crawl_budget=args.budget)
     
-    all_features = extractor.get_all_artist_features()
\ No newline at end of file
+    all_features = extractor.get_all_artist_features(incremental=args.incremental, resume=args.resume)
+    extractor.close()
\ No newline at end of file
@@ -0,0 +1,191 @@
+import os
+import sys
+import json
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Tuple
+from AtomicFile import atomic_path
+
+MAGIC = b"RIFFEDGE"
+VERSION = 1
+# arrays start on ALIGNMENT-byte boundaries so they can be memory-mapped in place
+ALIGNMENT = 64
+
+INDPTR_DTYPE = np.int64
+INDICES_DTYPE = np.int32
+WEIGHTS_DTYPE = np.float32
+
+
+class EdgeGraph:
+
+    """The artist graph as loaded from an EdgeStore: an interned node table
+       (names, with node ID = position) and, per relation type, a CSR matrix of
+       outgoing edges - indptr[i]:indptr[i + 1] slices indices (target IDs) and
+       weights for source node i. The arrays are read-only memory maps."""
+
+    def __init__(self, names: List[str], csr: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]):
+
+        self.names = names
+        self.csr = csr
+        self._ids = None
+
+    @property
+    def ids(self) -> Dict[str, int]:
+
+        # built on first use - most readers only need the arrays
+        if self._ids is None:
+            self._ids = {name: i for i, name in enumerate(self.names)}
+        return self._ids
+
+    @property
+    def relations(self) -> List[str]:
+
+        return list(self.csr)
+
+    def num_edges(self, relation: str=None) -> int:
+
+        relations = [relation] if relation else self.relations
+        return sum(len(self.csr[r][1]) for r in relations)
+
+    def coo(self, relation: str) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+
+        """(sources, targets, weights) of every edge of one relation type."""
+
+        indptr, indices, weights = self.csr[relation]
+        sources = np.repeat(np.arange(len(indptr) - 1, dtype=INDICES_DTYPE), np.diff(indptr))
+        return sources, indices, weights
+
+    def neighbours(self, name: str, relation: str) -> List[Tuple[str, float]]:
+
+        indptr, indices, weights = self.csr[relation]
+        i = self.ids.get(name)
+        if i is None:
+            return []
+
+        start, end = indptr[i], indptr[i + 1]
+        return [(self.names[j], float(w)) for j, w in zip(indices[start:end], weights[start:end])]
+
+    def to_frame(self) -> pd.DataFrame:
+
+        """Edge list with the old JSON's columns (origin, target, type, weight)."""
+
+        names = np.array(self.names, dtype=object)
+        frames = []
+        for relation in self.relations:
+            sources, targets, weights = self.coo(relation)
+            frames.append(pd.DataFrame({"origin": names[sources], "target": names[targets],
+                                        "type": relation, "weight": np.asarray(weights, dtype=float)}))
+
+        if not frames:
+            return pd.DataFrame(columns=["origin", "target", "type", "weight"])
+        return pd.concat(frames, ignore_index=True)
+
+    def to_records(self) -> List[dict]:
+
+        return self.to_frame().to_dict("records")
+
+
+class EdgeStore:
+
+    """Single-file binary store for the artist relationships.
+
+       Layout: MAGIC, then a little-endian uint64 header length, then a JSON
+       header (the node table and, per relation, the offset and length of its
+       indptr/indices/weights arrays), then the arrays themselves. Names are
+       stored once, not on every edge, and read() memory-maps the arrays rather
+       than parsing anything, so even a very large graph opens almost instantly
+       and only the pages actually touched are read from disk."""
+
+    def __init__(self, path: str):
+
+        self.path = path
+
+    def exists(self) -> bool:
+
+        return os.path.exists(self.path)
+
+    @staticmethod
+    def _build(relations: List[dict]) -> Tuple[List[str], Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]]]:
+
+        edges = pd.DataFrame(relations, columns=["origin", "target", "type", "weight"])
+
+        names = sorted(set(edges["origin"]) | set(edges["target"]))
+        ids = pd.Index(names)
+
+        csr = {}
+        for relation, group in edges.groupby("type", sort=False):
+            sources = ids.get_indexer(group["origin"])
+            # stable, so edges keep their original order within each source
+            order = np.argsort(sources, kind="stable")
+            indptr = np.zeros(len(names) + 1, dtype=INDPTR_DTYPE)
+            np.cumsum(np.bincount(sources, minlength=len(names)), out=indptr[1:])
+            csr[relation] = (indptr,
+                             ids.get_indexer(group["target"])[order].astype(INDICES_DTYPE),
+                             group["weight"].to_numpy(dtype=WEIGHTS_DTYPE)[order])
+
+        return names, csr
+
+    def write(self, relations: List[dict]):
+
+        """Writes a list of edge dicts ({"origin", "target", "type", "weight"})."""
+
+        names, csr = self._build(relations)
+
+        # lay the arrays out first, so the header can point at them
+        arrays, layout, offset = [], {}, 0
+        for relation, (indptr, indices, weights) in csr.items():
+            layout[relation] = {}
+            for key, array in [("indptr", indptr), ("indices", indices), ("weights", weights)]:
+                offset += -offset % ALIGNMENT
+                layout[relation][key] = {"offset": offset, "length": len(array), "dtype": array.dtype.str}
+                arrays.append((offset, array))
+                offset += array.nbytes
+
+        header = json.dumps({"version": VERSION, "names": names, "relations": layout}).encode("utf-8")
+        data_start = len(MAGIC) + 8 + len(header)
+        data_start += -data_start % ALIGNMENT
+
+        with atomic_path(self.path) as tmp_path, open(tmp_path, "wb") as f:
+            f.write(MAGIC)
+            f.write(len(header).to_bytes(8, "little"))
+            f.write(header)
+            for array_offset, array in arrays:
+                f.seek(data_start + array_offset)
+                f.write(np.ascontiguousarray(array).tobytes())
+            f.truncate(data_start + offset)
+
+        print(f"EdgeStore: {len(relations)} edges between {len(names)} artists written to {self.path}.")
+
+    def read(self) -> EdgeGraph:
+
+        with open(self.path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"EdgeStore: {self.path} is not an edge store.")
+            header_length = int.from_bytes(f.read(8), "little")
+            header = json.loads(f.read(header_length))
+
+        if header["version"] != VERSION:
+            raise ValueError(f"EdgeStore: {self.path} has unsupported version {header['version']}.")
+
+        data_start = len(MAGIC) + 8 + header_length
+        data_start += -data_start % ALIGNMENT
+
+        def array(spec):
+            # np.memmap can't map zero bytes
+            if spec["length"] == 0:
+                return np.empty(0, dtype=spec["dtype"])
+            return np.memmap(self.path, dtype=spec["dtype"], mode="r",
+                             offset=data_start + spec["offset"], shape=(spec["length"],))
+
+        csr = {relation: (array(spec["indptr"]), array(spec["indices"]), array(spec["weights"]))
+               for relation, spec in header["relations"].items()}
+
+        return EdgeGraph(header["names"], csr)
+
+
+if __name__ == "__main__":
+
+    # convert old JSON outputs: python EdgeStore.py artist_relationships.json [...]
+    for json_path in sys.argv[1:]:
+        with open(json_path, "r") as f:
+            EdgeStore(os.path.splitext(json_path)[0] + ".edges").write(json.load(f))
@@ -0,0 +1,193 @@
+import os
+import ast
+import sys
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+from typing import List
+from AtomicFile import atomic_path
+
+# one row per artist. List-valued features are native Arrow lists (and the festival
+# coperformer counts a map), so nothing downstream has to re-parse Python reprs
+SCHEMA = pa.schema([("name", pa.string()),
+                    # stable ID from the ArtistResolver
+                    ("artist_id", pa.int64()),
+                    ("uri", pa.string()),
+                    ("genres", pa.list_(pa.string())),
+                    ("albums", pa.int64()),
+                    ("tracks", pa.int64()),
+                    # Spotify release dates can be just a year, or a year and month
+                    ("last_album_date", pa.string()),
+                    ("first_album_date", pa.string()),
+                    ("popularity", pa.int64()),
+                    ("followers", pa.int64()),
+                    ("playlist_count", pa.int64()),
+                    ("spotify_url", pa.string()),
+                    ("image_320", pa.string()),
+                    ("lastfm_listeners", pa.int64()),
+                    ("lastfm_playcount", pa.int64()),
+                    ("personal_playcount", pa.int64()),
+                    ("lastfm_tags", pa.list_(pa.string())),
+                    ("summary", pa.string()),
+                    ("tour_status", pa.string()),
+                    ("tour_date", pa.date32()),
+                    ("tour_coperformers", pa.list_(pa.string())),
+                    ("festival_coperformers", pa.map_(pa.string(), pa.int64()))])
+
+# what a model can be trained on directly - no text, no lists
+NUMERIC_FEATURES = [field.name for field in SCHEMA if pa.types.is_integer(field.type) and field.name != "artist_id"]
+
+
+def numeric_matrix(features: pd.DataFrame) -> np.ndarray:
+
+    """NUMERIC_FEATURES as a float32 matrix ready for similarity or training: counts
+       are heavy-tailed (followers, playcounts), so log-scaled, then standardized
+       per column. Missing values count as 0."""
+
+    numeric = np.log1p(features[NUMERIC_FEATURES].fillna(0).clip(lower=0).to_numpy(dtype=np.float32))
+    return (numeric - numeric.mean(axis=0)) / (numeric.std(axis=0) + 1e-6)
+
+
+def _is_missing(value) -> bool:
+
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def _as_list(value) -> list:
+
+    # sets (tour coperformers) are sorted so rewriting the same data gives the same file
+    if _is_missing(value) or isinstance(value, str):
+        return []
+    if isinstance(value, (set, frozenset)):
+        return sorted(value)
+
+    return list(value)
+
+
+def _as_map(value) -> list:
+
+    if _is_missing(value):
+        return []
+    # maps come back from read() as dicts, but pyarrow can also hand back (key, value) pairs
+    items = value.items() if isinstance(value, dict) else value
+
+    return [(key, int(count)) for key, count in items]
+
+
+def _as_string(value):
+
+    # e.g. image_320 is [] for artists with fewer than two images
+    if _is_missing(value) or isinstance(value, (list, tuple)):
+        return None
+
+    return str(value)
+
+
+def _parse_repr(value):
+
+    """Parses the stringified lists, sets and Counters of the old CSV outputs."""
+
+    if _is_missing(value) or value in ("", "set()", "Counter()"):
+        return None
+    if value.startswith("Counter(") and value.endswith(")"):
+        value = value[len("Counter("):-1]
+
+    return ast.literal_eval(value)
+
+
+class FeatureStore:
+
+    """Parquet-backed artist feature table with a fixed, typed schema (SCHEMA).
+
+       write() coerces a feature frame to the schema - lists, sets and Counters
+       become native list and map columns, counts become integers (Lastfm
+       reports them as strings) - and replaces the file atomically.
+
+       read(columns) only decodes the columns asked for, so e.g.
+       read(["name"] + NUMERIC_FEATURES) never touches the summaries or the list
+       columns at all. List columns come back as NumPy arrays, and festival
+       coperformers as dicts."""
+
+    def __init__(self, path: str):
+
+        self.path = path
+
+    def exists(self) -> bool:
+
+        return os.path.exists(self.path)
+
+    @staticmethod
+    def to_table(features: pd.DataFrame) -> pa.Table:
+
+        extra = [column for column in features.columns if column not in SCHEMA.names]
+        if extra:
+            print(f"FeatureStore: dropping columns outside the schema: {extra}.")
+
+        arrays = []
+        for field in SCHEMA:
+            values = features[field.name] if field.name in features else pd.Series([None] * len(features), dtype=object)
+
+            if pa.types.is_list(field.type):
+                values = [_as_list(value) for value in values]
+            elif pa.types.is_map(field.type):
+                values = [_as_map(value) for value in values]
+            elif pa.types.is_integer(field.type):
+                values = pd.to_numeric(values, errors="coerce").astype("Int64")
+            elif pa.types.is_date(field.type):
+                values = [None if pd.isna(value) else value
+                          for value in pd.to_datetime(values, errors="coerce").dt.date]
+            else:
+                values = [_as_string(value) for value in values]
+
+            arrays.append(pa.array(values, type=field.type, from_pandas=True))
+
+        return pa.Table.from_arrays(arrays, schema=SCHEMA)
+
+    def write(self, features: pd.DataFrame):
+
+        table = self.to_table(features)
+
+        with atomic_path(self.path) as tmp_path:
+            pq.write_table(table, tmp_path, compression="zstd")
+
+        print(f"FeatureStore: {table.num_rows} artists written to {self.path}.")
+
+    def read_table(self, columns: List[str]=None) -> pa.Table:
+
+        if columns is not None:
+            # files written before a column joined the schema simply don't have it
+            present = set(pq.read_schema(self.path).names)
+            columns = [column for column in columns if column in present]
+
+        return pq.read_table(self.path, columns=columns)
+
+    def read(self, columns: List[str]=None) -> pd.DataFrame:
+
+        """Returns the feature table, or just the given columns of it."""
+
+        return self.read_table(columns).to_pandas(maps_as_pydicts="strict")
+
+    def read_numeric(self) -> pd.DataFrame:
+
+        """Artist names and their numeric features, e.g. for training."""
+
+        return self.read(["name", "artist_id"] + NUMERIC_FEATURES)
+
+
+def read_legacy_csv(path: str) -> pd.DataFrame:
+
+    """Loads a feature table written as CSV by older versions of the pipeline,
+       parsing its stringified list, set and Counter columns."""
+
+    repr_columns = [field.name for field in SCHEMA
+                    if pa.types.is_list(field.type) or pa.types.is_map(field.type)]
+
+    return pd.read_csv(path, converters={column: _parse_repr for column in repr_columns})
+
+
+if __name__ == "__main__":
+
+    # convert old CSV outputs: python FeatureStore.py ALL_FEATURES.csv [...]
+    for csv_path in sys.argv[1:]:
+        FeatureStore(os.path.splitext(csv_path)[0] + ".parquet").write(read_legacy_csv(csv_path))
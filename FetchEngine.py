@@ -0,0 +1,121 @@
+import asyncio
+import aiohttp
+from threading import Thread
+from RateLimiter import TokenBucket, parse_retry_after
+
+# Last.fm signals throttling with error 29 in an otherwise normal 200 response,
+# and an unknown artist with error 6
+LASTFM_RATE_LIMIT_ERROR = 29
+LASTFM_NOT_FOUND_ERROR = 6
+
+
+class NotFoundError(Exception):
+
+    """The provider answered, and the thing asked for does not exist."""
+
+
+def classify_error(e: Exception) -> str:
+
+    """Sorts a failed lookup into "not_found" (the provider says the artist 
+       doesn't exist - worth remembering for a while) or "transient" (timeouts,
+       outages, throttling, anything unexpected - worth retrying soon)."""
+
+    # spotipy.SpotifyException carries http_status, aiohttp.ClientResponseError status
+    status = getattr(e, "http_status", None) or getattr(e, "status", None)
+    if isinstance(e, NotFoundError) or status == 404:
+        return "not_found"
+
+    return "transient"
+
+
+class FetchEngine:
+
+    """Shared HTTP client for the Last.fm and Ticketmaster stages.
+
+       A single aiohttp session runs on an event loop in a background thread, so
+       keep-alive connections are pooled across every stage (and every worker
+       thread) instead of each request paying a fresh TCP+TLS handshake. The
+       connector caps open sockets overall and per host, which also bounds how
+       many requests are in flight against each API at once.
+
+       get_json() is a blocking call that is safe to use from any number of
+       ThreadPoolExecutor workers at once - the workers only wait on the loop,
+       the sockets themselves are shared.
+
+       Requests made with a limiter take a token from it first. Throttled
+       responses (429, or Last.fm's error 29) hold the limiter for Retry-After
+       seconds - or an exponential backoff if there is no header - and are
+       retried up to max_retries times."""
+
+    def __init__(self, max_connections: int=32, max_per_host: int=8, timeout: float=30, 
+                 max_retries: int=4):
+
+        self.max_connections = max_connections
+        self.max_per_host = max_per_host
+        self.timeout = timeout
+        self.max_retries = max_retries
+
+        self.loop = asyncio.new_event_loop()
+        self.thread = Thread(target=self.loop.run_forever, name="FetchEngine", daemon=True)
+        self.thread.start()
+
+        self.session = self._run(self._open_session())
+
+    async def _open_session(self):
+
+        connector = aiohttp.TCPConnector(limit=self.max_connections,
+                                         limit_per_host=self.max_per_host,
+                                         ttl_dns_cache=300)
+
+        return aiohttp.ClientSession(connector=connector,
+                                     timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+    def _run(self, coro):
+
+        """Runs a coroutine on the engine's loop and blocks until it finishes."""
+
+        return asyncio.run_coroutine_threadsafe(coro, self.loop).result()
+
+    async def _get_json(self, url: str, params: dict=None, limiter: TokenBucket=None):
+
+        for attempt in range(self.max_retries + 1):
+
+            if limiter:
+                await limiter.acquire_async()
+
+            async with self.session.get(url, params=params) as response:
+                # Last.fm reports most errors in a 200 response body, so leave
+                # interpreting the payload to the caller; content_type=None because
+                # neither API is consistent about its JSON content type
+                if response.status == 429:
+                    if attempt == self.max_retries:
+                        response.raise_for_status()
+                else:
+                    payload = await response.json(content_type=None)
+                    throttled = isinstance(payload, dict) and payload.get("error") == LASTFM_RATE_LIMIT_ERROR
+                    if not throttled or attempt == self.max_retries:
+                        return payload
+
+                retry_after = parse_retry_after(response.headers.get("Retry-After"), default=2 ** attempt)
+
+            print(f"FetchEngine: throttled by {response.url.host}, retrying in {retry_after:.1f}s.")
+            if limiter:
+                limiter.block_for(retry_after)
+            else:
+                await asyncio.sleep(retry_after)
+
+    def get_json(self, url: str, params: dict=None, limiter: TokenBucket=None):
+
+        """GETs url (rate limited by limiter, if given) and returns the decoded JSON body."""
+
+        return self._run(self._get_json(url, params, limiter))
+
+    def close(self):
+
+        if self.loop.is_closed():
+            return
+
+        self._run(self.session.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
+        self.loop.close()
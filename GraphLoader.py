@@ -0,0 +1,258 @@
+import os
+import time
+import numpy as np
+import scipy.sparse as sp
+import multiprocessing
+from typing import Dict, List
+from concurrent.futures import ProcessPoolExecutor
+from FeatureStore import FeatureStore, NUMERIC_FEATURES, numeric_matrix
+from EdgeStore import EdgeStore
+from TagVectorizer import TagVectorizer
+
+
+class HeteroGraph:
+
+    """The artist knowledge graph in training form: a node table (names), a node
+       feature matrix x (CSR - log-scaled, standardized numeric features, then
+       multi-hot genres and tags; row i is node i), and per relation type a CSR
+       adjacency (indptr, indices, weights) over the same node IDs.
+
+       Every relation also gets a reverse ("rev_similarity", ...), so a node can
+       receive messages along both directions of an edge. Artists that only
+       appear in the relationships (never made it into the feature table) have
+       all-zero features and has_features False."""
+
+    def __init__(self, names: List[str], x: sp.csr_matrix, adjacency: Dict[str, tuple], has_features: np.ndarray):
+
+        self.names = names
+        self.x = x
+        self.adjacency = adjacency
+        self.has_features = has_features
+
+    @property
+    def num_nodes(self) -> int:
+
+        return len(self.names)
+
+    @property
+    def relations(self) -> List[str]:
+
+        return list(self.adjacency)
+
+    @classmethod
+    def load(cls, features_path: str, edges_path: str, vocabulary_path: str=None):
+
+        """Builds the graph from the pipeline's outputs. The tag vocabulary is the
+           pipeline's (<features>.vocab.json) if there is one, so feature columns
+           line up across runs."""
+
+        start = time.time()
+        features = FeatureStore(features_path).read(["name"] + NUMERIC_FEATURES + ["genres", "lastfm_tags"])
+        edges = EdgeStore(edges_path).read()
+
+        # node table - every artist in either output, sorted like the EdgeStore's
+        names = np.union1d(np.array(edges.names, dtype=object), features["name"].to_numpy(dtype=object))
+        n = len(names)
+        edge_ids = np.searchsorted(names, np.array(edges.names, dtype=object))
+        feature_ids = np.searchsorted(names, features["name"].to_numpy(dtype=object))
+
+        vectorizer = TagVectorizer(vocabulary_path or os.path.splitext(features_path)[0] + ".vocab.json")
+        tags = vectorizer.fit_transform(features["genres"], features["lastfm_tags"])
+
+        rows = sp.csr_matrix(sp.hstack([sp.csr_matrix(numeric_matrix(features)), tags]), dtype=np.float32)
+        # scatter the feature rows into node order
+        x = sp.csr_matrix((np.ones(len(feature_ids), dtype=np.float32), (feature_ids, np.arange(len(feature_ids)))),
+                          shape=(n, len(feature_ids))) @ rows
+        has_features = np.zeros(n, dtype=bool)
+        has_features[feature_ids] = True
+
+        adjacency = {}
+        for relation in edges.relations:
+            sources, targets, weights = edges.coo(relation)
+            matrix = sp.csr_matrix((np.asarray(weights, dtype=np.float32), (edge_ids[sources], edge_ids[targets])),
+                                   shape=(n, n))
+            reverse = sp.csr_matrix(matrix.T)
+            adjacency[relation] = (matrix.indptr, matrix.indices, matrix.data)
+            adjacency[f"rev_{relation}"] = (reverse.indptr, reverse.indices, reverse.data)
+
+        graph = cls(list(names), sp.csr_matrix(x), adjacency, has_features)
+        print(f"HeteroGraph: {n} nodes, {x.shape[1]} features and {sum(len(a[1]) for a in adjacency.values())} edges "
+              f"over {len(adjacency)} relations, built in {time.time() - start:.2f}s.")
+        return graph
+
+
+def sample_neighbours(indptr: np.ndarray, indices: np.ndarray, nodes: np.ndarray, fanout: int,
+                      rng: np.random.Generator):
+
+    """Up to fanout neighbours of each of nodes, without replacement (all of them
+       for nodes with fewer), from one CSR adjacency. Vectorized over all nodes:
+       each candidate edge gets a random key and every node keeps its fanout
+       lowest. Returns (neighbours, positions into nodes) edge arrays."""
+
+    starts, ends = indptr[nodes], indptr[nodes + 1]
+    degrees = ends - starts
+    if degrees.sum() == 0:
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+
+    owners = np.repeat(np.arange(len(nodes)), degrees)
+    # position of every candidate edge in indices
+    edges = np.arange(degrees.sum()) - np.repeat(np.cumsum(degrees) - degrees, degrees) + np.repeat(starts, degrees)
+
+    if fanout is not None and (degrees > fanout).any():
+        # sort by node, then by a random key in [0, 1), and keep the first fanout of each
+        order = np.argsort(owners + rng.random(len(owners)), kind="stable")
+        owners, edges = owners[order], edges[order]
+        keep = np.arange(len(owners)) - np.searchsorted(owners, owners) < fanout
+        owners, edges = owners[keep], edges[keep]
+
+    return indices[edges].astype(np.int64), owners
+
+
+class MiniBatch:
+
+    """One sampled subgraph: nodes (global IDs; the first num_seeds are the seeds),
+       their features x (CSR rows of HeteroGraph.x - .toarray() for a dense
+       matrix), and per relation the sampled edges as
+       (source, target) positions into nodes, pointing from neighbour to the
+       node it was sampled for - the direction messages flow."""
+
+    def __init__(self, nodes: np.ndarray, num_seeds: int, x: sp.csr_matrix, edges: Dict[str, tuple]):
+
+        self.nodes = nodes
+        self.num_seeds = num_seeds
+        self.x = x
+        self.edges = edges
+
+    @property
+    def seeds(self) -> np.ndarray:
+
+        return self.nodes[:self.num_seeds]
+
+
+def sample_batch(graph: HeteroGraph, seeds: np.ndarray, fanouts: List[int], rng: np.random.Generator) -> MiniBatch:
+
+    """Neighbour sampling from seeds, one hop per entry of fanouts (the max number
+       of neighbours per node, per relation, at that hop; None for all)."""
+
+    nodes = np.asarray(seeds, dtype=np.int64)
+    # global ID -> position in nodes (-1 for not sampled yet)
+    local = np.full(graph.num_nodes, -1, dtype=np.int64)
+    local[nodes] = np.arange(len(nodes))
+    frontier = nodes
+    sources, targets = {r: [] for r in graph.relations}, {r: [] for r in graph.relations}
+
+    for fanout in fanouts:
+        hop = []
+        for relation, (indptr, indices, _) in graph.adjacency.items():
+            neighbours, owners = sample_neighbours(indptr, indices, frontier, fanout, rng)
+            hop.append((relation, neighbours, local[frontier[owners]]))
+
+        # nodes reached for the first time join the batch (and are the next frontier)
+        reached = np.concatenate([neighbours for _, neighbours, _ in hop])
+        frontier = np.unique(reached[local[reached] < 0])
+        local[frontier] = len(nodes) + np.arange(len(frontier))
+        nodes = np.concatenate([nodes, frontier])
+
+        for relation, neighbours, owner_positions in hop:
+            sources[relation].append(local[neighbours])
+            targets[relation].append(owner_positions)
+
+    edges = {relation: (np.concatenate(sources[relation]), np.concatenate(targets[relation]))
+             for relation in graph.relations}
+
+    # sparse, so batches stay cheap to pass back from worker processes
+    return MiniBatch(nodes, len(seeds), graph.x[nodes], edges)
+
+
+# the graph each worker process samples from - inherited from the parent when forked
+_worker_graph = None
+
+def _init_worker(graph: HeteroGraph):
+
+    global _worker_graph
+    _worker_graph = graph
+
+def _sample_in_worker(seeds: np.ndarray, fanouts: List[int], seed) -> MiniBatch:
+
+    return sample_batch(_worker_graph, seeds, fanouts, np.random.default_rng(seed))
+
+
+class NeighbourLoader:
+
+    """Iterates over mini-batches for GNN training: the seed nodes (default: every
+       node with features) are shuffled each epoch, split into batches of
+       batch_size, and each batch is expanded by sample_batch with fanouts.
+
+       With num_workers > 0, batches are sampled by that many forked worker
+       processes, up to prefetch batches ahead of the consumer - the graph is
+       shared with them copy-on-write rather than pickled. Batches come out in
+       order, and the same seed and epoch always give the same batches."""
+
+    def __init__(self, graph: HeteroGraph, fanouts: List[int], batch_size: int=512, seeds: np.ndarray=None,
+                 shuffle: bool=True, num_workers: int=0, prefetch: int=None, seed: int=0):
+
+        self.graph = graph
+        self.fanouts = fanouts
+        self.batch_size = batch_size
+        self.seeds = np.flatnonzero(graph.has_features) if seeds is None else np.asarray(seeds, dtype=np.int64)
+        self.shuffle = shuffle
+        self.num_workers = num_workers
+        self.prefetch = prefetch or 2 * max(num_workers, 1)
+        self.seed = seed
+        self.epoch = 0
+
+        self.executor = None
+        if num_workers > 0:
+            self.executor = ProcessPoolExecutor(num_workers, mp_context=multiprocessing.get_context("fork"),
+                                                initializer=_init_worker, initargs=(graph,))
+
+    def __len__(self) -> int:
+
+        return -(-len(self.seeds) // self.batch_size)
+
+    def _batches(self) -> list:
+
+        seeds = self.seeds
+        if self.shuffle:
+            seeds = np.random.default_rng((self.seed, self.epoch)).permutation(seeds)
+
+        # one RNG seed per batch, so results don't depend on which worker samples it
+        return [(seeds[start:start + self.batch_size], (self.seed, self.epoch, i))
+                for i, start in enumerate(range(0, len(seeds), self.batch_size))]
+
+    def __iter__(self):
+
+        batches = self._batches()
+        self.epoch += 1
+
+        if self.executor is None:
+            for batch_seeds, seed in batches:
+                yield sample_batch(self.graph, batch_seeds, self.fanouts, np.random.default_rng(seed))
+            return
+
+        pending = []
+        for batch_seeds, seed in batches:
+            pending.append(self.executor.submit(_sample_in_worker, batch_seeds, self.fanouts, seed))
+            if len(pending) >= self.prefetch:
+                yield pending.pop(0).result()
+        for future in pending:
+            yield future.result()
+
+    def close(self):
+
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures=True)
+
+
+if __name__ == "__main__":
+
+    # time one epoch of sampling: python GraphLoader.py features.parquet artist_relationships.edges [workers]
+    import sys
+
+    graph = HeteroGraph.load(sys.argv[1], sys.argv[2])
+    loader = NeighbourLoader(graph, fanouts=[10, 5], num_workers=int(sys.argv[3]) if len(sys.argv) > 3 else 0)
+
+    start = time.time()
+    sampled = sum(len(batch.nodes) for batch in loader)
+    print(f"NeighbourLoader: {len(loader)} batches ({sampled} sampled nodes) in {time.time() - start:.2f}s.")
+    loader.close()
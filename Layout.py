@@ -0,0 +1,308 @@
+import os
+import json
+import hashlib
+import numpy as np
+from typing import List
+from AtomicFile import atomic_path
+
+
+# FFTs of the far-field kernel per grid size - in units of cells, so one grid size
+# serves every span (see _repulsion)
+_kernel_ffts = {}
+
+def _far_kernel_fft(grid_size: int) -> tuple:
+
+    """rfft2 of the (x, y) force kernel a / (a^2 + b^2) over every cell offset (a, b),
+       zero within the 3x3 neighbourhood, padded for a linear convolution."""
+
+    if grid_size not in _kernel_ffts:
+        steps = np.arange(-(grid_size - 1), grid_size, dtype=float)
+        dx, dy = np.meshgrid(steps, steps, indexing="ij")
+        kernel = 1.0 / (dx ** 2 + dy ** 2 + 1e-12)
+        kernel[grid_size - 2:grid_size + 1, grid_size - 2:grid_size + 1] = 0.0
+        shape = (3 * grid_size - 2,) * 2
+        _kernel_ffts[grid_size] = tuple(np.fft.rfft2(kernel * d, shape) for d in (dx, dy))
+
+    return _kernel_ffts[grid_size]
+
+
+def _repulsion(pos: np.ndarray, k: float, grid_size: int, max_pairs: int=2 ** 22) -> np.ndarray:
+
+    """Fruchterman-Reingold repulsion (k^2 / d), approximated on a grid: nodes are
+       binned into grid_size x grid_size cells, the push of cells more than one
+       cell apart is a convolution of the cell masses with the force kernel (done
+       with FFTs, particle-mesh style), and only nodes in neighbouring cells repel
+       each other exactly. Costs O(cells log cells + n * nodes per cell) rather
+       than O(n^2)."""
+
+    n = len(pos)
+    lo = pos.min(axis=0)
+    span = (pos.max(axis=0) - lo).max() + 1e-9
+    cells = np.minimum(((pos - lo) / span * grid_size).astype(np.int64), grid_size - 1)
+    cell_ids = cells[:, 0] * grid_size + cells[:, 1]
+    mass = np.bincount(cell_ids, minlength=grid_size * grid_size)
+
+    # far field - k^2 d / |d|^2 with d in cells of span / grid_size is the unit kernel
+    # times k^2 * grid_size / span
+    shape = (3 * grid_size - 2,) * 2
+    mass_fft = np.fft.rfft2(mass.reshape(grid_size, grid_size).astype(float), shape)
+    inner = slice(grid_size - 1, 2 * grid_size - 1)
+    field = np.stack([np.fft.irfft2(mass_fft * kernel_fft, shape)[inner, inner]
+                      for kernel_fft in _far_kernel_fft(grid_size)], axis=-1).reshape(-1, 2)
+    disp = field[cell_ids] * (k * k * grid_size / span)
+
+    # near field - exact, between each node and every node in its 3x3 neighbourhood of
+    # cells. Pairs are expanded in bulk, one neighbour offset at a time (and in chunks
+    # of at most max_pairs), rather than looping over cells in Python. Each pair is
+    # visited once - its own cell and half the neighbour offsets - and pushes both ends
+    order = np.argsort(cell_ids, kind="stable")
+    starts = np.cumsum(mass) - mass
+    for offset_x, offset_y in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)):
+        x, y = cells[:, 0] + offset_x, cells[:, 1] + offset_y
+        nodes = np.flatnonzero((x >= 0) & (x < grid_size) & (y >= 0) & (y < grid_size))
+        neighbour_cells = x[nodes] * grid_size + y[nodes]
+        counts = mass[neighbour_cells]
+        ends = np.cumsum(counts)
+
+        chunk_start = 0
+        while chunk_start < len(nodes):
+            # as many nodes as fit in max_pairs pairs, but always at least one
+            chunk_end = max(np.searchsorted(ends, (ends[chunk_start] - counts[chunk_start]) + max_pairs, "right"),
+                            chunk_start + 1)
+            chunk_counts = counts[chunk_start:chunk_end]
+            i = np.repeat(nodes[chunk_start:chunk_end], chunk_counts)
+            within = np.arange(len(i)) - np.repeat(np.cumsum(chunk_counts) - chunk_counts, chunk_counts)
+            j = order[np.repeat(starts[neighbour_cells[chunk_start:chunk_end]], chunk_counts) + within]
+            chunk_start = chunk_end
+
+            if offset_x == offset_y == 0:
+                i, j = i[i < j], j[i < j]
+            delta = pos[i] - pos[j]
+            push = k * k / ((delta ** 2).sum(axis=1) + 1e-9)
+            for axis in range(2):
+                force = delta[:, axis] * push
+                disp[:, axis] += np.bincount(i, weights=force, minlength=n) - np.bincount(j, weights=force, minlength=n)
+
+    return disp
+
+
+def force_layout(n: int, sources: np.ndarray, targets: np.ndarray, weights: np.ndarray=None,
+                 iterations: int=50, pos: np.ndarray=None, seed: int=0, grid_size: int=None,
+                 gravity: float=0.05, temperature: float=None) -> np.ndarray:
+
+    """Force-directed layout of n nodes joined by edges (sources[i], targets[i]),
+       in the spirit of nx.spring_layout but with grid-approximated repulsion (see
+       _repulsion), so each iteration is roughly linear in the number of nodes
+       and edges. Heavier edges pull harder. A weak gravity towards the centre
+       keeps disconnected pieces from drifting off. Returns an (n, 2) array;
+       pos, if given, is the starting point instead of a random one, and a low
+       temperature (the most a node may move per step) only refines it."""
+
+    rng = np.random.default_rng(seed)
+    pos = rng.random((n, 2)) if pos is None else np.array(pos, dtype=float)
+    if n < 2:
+        return pos
+
+    weights = np.ones(len(sources)) if weights is None else np.asarray(weights, dtype=float)
+    # ~1 node per cell at the start - the layout contracts, so cells fill up as it
+    # runs. Finer grids make the far field more accurate and leave fewer exact pairs
+    # in the near field; past ~256 the FFTs dominate instead
+    grid_size = grid_size or int(np.clip(np.sqrt(n), 1, 256))
+
+    # same optimal distance and cooling schedule as networkx
+    k = np.sqrt(1.0 / n)
+    temperature = temperature or 0.1 * max(np.ptp(pos[:, 0]), np.ptp(pos[:, 1]), 1e-3)
+    cooling = temperature / (iterations + 1)
+
+    for _ in range(iterations):
+        disp = _repulsion(pos, k, grid_size)
+
+        # attraction (d^2 / k along each edge), accumulated per node with bincount
+        delta = pos[sources] - pos[targets]
+        dist = np.sqrt((delta ** 2).sum(axis=1)) + 1e-9
+        pull = delta * (dist * weights / k)[:, None]
+        for axis in range(2):
+            disp[:, axis] -= np.bincount(sources, weights=pull[:, axis], minlength=n)
+            disp[:, axis] += np.bincount(targets, weights=pull[:, axis], minlength=n)
+
+        disp -= gravity * (pos - pos.mean(axis=0)) / k
+
+        # each node moves at most `temperature` per step
+        length = np.sqrt((disp ** 2).sum(axis=1)) + 1e-9
+        pos += disp * (np.minimum(length, temperature) / length)[:, None]
+        temperature -= cooling
+
+    return pos
+
+
+def warm_start(names: List[str], sources: np.ndarray, targets: np.ndarray,
+               previous_names: List[str], previous_pos: np.ndarray, seed: int=0):
+
+    """Starting positions for a graph that changed since previous_pos was laid out:
+       artists already in the old layout keep their positions, and new ones are
+       placed at the centroid of their already-placed neighbours (spreading out
+       a few hops), or at random within the old layout if they have none.
+       Returns the positions and a mask of the new nodes."""
+
+    rng = np.random.default_rng(seed)
+    n = len(names)
+    previous = {name: i for i, name in enumerate(previous_names)}
+    previous_index = np.array([previous.get(name, -1) for name in names], dtype=np.int64)
+    known = previous_index >= 0
+
+    pos = np.zeros((n, 2))
+    pos[known] = previous_pos[previous_index[known]]
+    if not known.any():
+        return rng.random((n, 2)), ~known
+
+    lo, hi = pos[known].min(axis=0), pos[known].max(axis=0)
+    # small jitter so new artists sharing all their neighbours don't coincide
+    jitter = 0.01 * max((hi - lo).max(), 1e-3)
+
+    placed = known.copy()
+    ends = np.concatenate([sources, targets])
+    others = np.concatenate([targets, sources])
+    for _ in range(3):
+        usable = placed[others]
+        count = np.bincount(ends[usable], minlength=n)
+        newly = ~placed & (count > 0)
+        if not newly.any():
+            break
+        for axis in range(2):
+            total = np.bincount(ends[usable], weights=pos[others[usable], axis], minlength=n)
+            pos[newly, axis] = total[newly] / count[newly]
+        pos[newly] += rng.normal(scale=jitter, size=(newly.sum(), 2))
+        placed |= newly
+
+    pos[~placed] = lo + rng.random(((~placed).sum(), 2)) * (hi - lo)
+
+    return pos, ~known
+
+
+def graph_hash(names: List[str], sources: np.ndarray, targets: np.ndarray,
+               weights: np.ndarray=None, **params) -> str:
+
+    """Fingerprint of a graph (and the layout parameters) to key cached layouts on."""
+
+    digest = hashlib.sha1()
+    digest.update("\0".join(names).encode("utf-8"))
+    for array in [sources, targets] + ([] if weights is None else [weights]):
+        digest.update(np.ascontiguousarray(array).tobytes())
+    digest.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+
+    return digest.hexdigest()
+
+
+class LayoutCache:
+
+    """Computed layouts on disk, one .npz (node names and positions) per graph hash,
+       plus a copy of the most recent one (per mode, if given) to warm-start the
+       next layout from when the graph has changed."""
+
+    def __init__(self, cache_dir: str):
+
+        self.cache_dir = cache_dir
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def get(self, key: str):
+
+        if not os.path.exists(self._path(key)):
+            return None
+
+        with np.load(self._path(key)) as layout:
+            return layout["pos"]
+
+    @staticmethod
+    def _latest_key(mode: str=None) -> str:
+
+        return f"latest_{mode}" if mode else "latest"
+
+    def latest(self, mode: str=None):
+
+        """(names, positions) of the last layout stored (for mode), or None."""
+
+        path = self._path(self._latest_key(mode))
+        if not os.path.exists(path):
+            return None
+
+        with np.load(path) as layout:
+            return list(layout["names"]), layout["pos"]
+
+    def put(self, key: str, names: List[str], pos: np.ndarray, mode: str=None):
+
+        for name in [key, self._latest_key(mode)]:
+            # np.savez is given a file, as it would append .npz to the temp name
+            with atomic_path(self._path(name)) as tmp_path, open(tmp_path, "wb") as f:
+                np.savez(f, names=np.array(names, dtype=str), pos=pos)
+
+
+def top_k(values: np.ndarray, k: int) -> np.ndarray:
+
+    """Indices of the k largest values (all of them if k is None), for level of
+       detail - e.g. drawing only the heaviest edges, or labelling only the
+       best-connected artists."""
+
+    values = np.asarray(values)
+    if k is None or k >= len(values):
+        return np.arange(len(values))
+
+    return np.argpartition(-values, k)[:k]
+
+
+def render_image(path: str, pos: np.ndarray, sources: np.ndarray, targets: np.ndarray,
+                 edge_colors, edge_widths, labels: dict=None, node_sizes=10,
+                 figure_size=(20, 20), title: str=None, legend: dict=None):
+
+    """Draws the layout straight from arrays (one LineCollection for every edge,
+       one scatter for every node) and saves it to path - no per-edge artists,
+       so tens of thousands of edges render in seconds."""
+
+    # a bare Figure rather than pyplot, so this works headless and under any backend
+    from matplotlib.figure import Figure
+    from matplotlib.collections import LineCollection
+    from matplotlib.lines import Line2D
+
+    fig = Figure(figsize=figure_size)
+    ax = fig.subplots()
+    segments = np.stack([pos[sources], pos[targets]], axis=1)
+    ax.add_collection(LineCollection(segments, colors=edge_colors, linewidths=edge_widths, alpha=0.5, zorder=1))
+    ax.scatter(pos[:, 0], pos[:, 1], s=node_sizes, c="lightblue", edgecolors="none", zorder=2)
+    for i, label in (labels or {}).items():
+        ax.annotate(label, pos[i], fontsize=6, ha="center", va="center", zorder=3)
+
+    if legend:
+        ax.legend(handles=[Line2D([0], [0], color=color, lw=2, label=label.title())
+                           for label, color in legend.items()], loc="upper right")
+    if title:
+        ax.set_title(title)
+    ax.autoscale()
+    ax.axis("off")
+
+    fig.savefig(path, dpi=150, bbox_inches="tight")
+    print(f"render_image: {len(pos)} nodes and {len(sources)} edges drawn to {path}.")
+
+
+def export_json(path: str, names: List[str], pos: np.ndarray, sources: np.ndarray, targets: np.ndarray,
+                relations, weights, node_sizes=None, edge_colors=None):
+
+    """Writes the laid-out graph as graphology-style JSON ({"nodes": [{key,
+       attributes}], "edges": [{source, target, attributes}]}), which WebGL
+       renderers such as sigma.js load directly."""
+
+    node_sizes = np.broadcast_to(np.ones(1) if node_sizes is None else node_sizes, (len(names),))
+    nodes = [{"key": name, "attributes": {"label": name, "x": float(x), "y": float(y), "size": float(size)}}
+             for name, (x, y), size in zip(names, pos, node_sizes)]
+
+    colors = [None] * len(sources) if edge_colors is None else edge_colors
+    edges = [{"source": names[s], "target": names[t],
+              "attributes": {"relation": relation, "weight": float(weight), **({"color": color} if color else {})}}
+             for s, t, relation, weight, color in zip(sources, targets, relations, weights, colors)]
+
+    with atomic_path(path) as tmp_path, open(tmp_path, "w") as f:
+        json.dump({"nodes": nodes, "edges": edges}, f)
+
+    print(f"export_json: {len(nodes)} nodes and {len(edges)} edges written to {path}.")
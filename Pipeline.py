@@ -0,0 +1,173 @@
+import os
+import time
+import pickle
+import shutil
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, List
+from AtomicFile import atomic_path
+
+
+class Stage:
+
+    """One step of the pipeline. fn is called with the stage's inputs as keyword
+       arguments and returns a dict holding (at least) the stage's outputs."""
+
+    def __init__(self, name: str, fn: Callable, inputs: List[str]=(), outputs: List[str]=()):
+
+        self.name = name
+        self.fn = fn
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+
+    def __repr__(self):
+
+        return f"Stage({self.name}: {self.inputs} -> {self.outputs})"
+
+
+class StageGraph:
+
+    """A small DAG of stages wired together by the names of their inputs and outputs.
+       run() starts every stage as soon as all of its inputs exist, so independent
+       stages run concurrently and the end-to-end time approaches the slowest path
+       through the graph rather than the sum of all stages.
+
+       With a checkpoint_dir, each stage's outputs are pickled there as soon as it
+       finishes. run(resume=True) loads those checkpoints and skips the stages that
+       already completed; clear_checkpoints() should be called once the run's
+       results are safely written elsewhere."""
+
+    def __init__(self, stages: List[Stage], max_workers: int=4, checkpoint_dir: str=None):
+
+        self.stages = stages
+        self.max_workers = max_workers
+        self.checkpoint_dir = checkpoint_dir
+        self.timings = {}
+
+        producers = {}
+        for stage in stages:
+            for output in stage.outputs:
+                if output in producers:
+                    raise ValueError(f"StageGraph: {output} is produced by both {producers[output]} and {stage.name}.")
+                producers[output] = stage.name
+        self.producers = producers
+
+    def _check(self, available: set):
+
+        """Fails fast on inputs nothing produces, and on stages that can never run 
+           (a dependency cycle, or waiting on one), instead of deadlocking mid-run."""
+
+        for stage in self.stages:
+            missing = [name for name in stage.inputs if name not in self.producers and name not in available]
+            if missing:
+                raise ValueError(f"StageGraph: no stage produces {missing}, needed by {stage.name}.")
+
+        # dry run in dependency order - whatever is left over can never start
+        available = set(available)
+        blocked = list(self.stages)
+        while True:
+            ready = [stage for stage in blocked if all(name in available for name in stage.inputs)]
+            if not ready:
+                break
+            for stage in ready:
+                blocked.remove(stage)
+                available.update(stage.outputs)
+
+        if blocked:
+            raise ValueError(f"StageGraph: {[stage.name for stage in blocked]} can never run - "
+                             f"they are in, or wait on, a dependency cycle.")
+
+    def _checkpoint_path(self, stage: Stage) -> str:
+
+        return os.path.join(self.checkpoint_dir, f"{stage.name}.pkl")
+
+    def _save_checkpoint(self, stage: Stage, outputs: dict):
+
+        os.makedirs(self.checkpoint_dir, exist_ok=True)
+        # a crash mid-write never leaves a truncated checkpoint
+        with atomic_path(self._checkpoint_path(stage)) as tmp_path, open(tmp_path, "wb") as f:
+            pickle.dump(outputs, f)
+
+    def _load_checkpoints(self) -> dict:
+
+        """Returns {stage name: outputs} for every stage with a checkpoint on disk."""
+
+        checkpoints = {}
+        for stage in self.stages:
+            if os.path.exists(self._checkpoint_path(stage)):
+                with open(self._checkpoint_path(stage), "rb") as f:
+                    checkpoints[stage.name] = pickle.load(f)
+
+        return checkpoints
+
+    def clear_checkpoints(self):
+
+        if self.checkpoint_dir and os.path.exists(self.checkpoint_dir):
+            shutil.rmtree(self.checkpoint_dir)
+
+    def _run_stage(self, stage: Stage, inputs: dict) -> dict:
+
+        start = time.perf_counter()
+        results = stage.fn(**inputs) or {}
+        self.timings[stage.name] = time.perf_counter() - start
+
+        missing = [name for name in stage.outputs if name not in results]
+        if missing:
+            raise ValueError(f"StageGraph: stage {stage.name} did not return {missing}.")
+
+        outputs = {name: results[name] for name in stage.outputs}
+        if self.checkpoint_dir:
+            self._save_checkpoint(stage, outputs)
+
+        return outputs
+
+    def run(self, resume: bool=False, **initial) -> dict:
+
+        """Runs every stage, starting from the given initial values, and returns all
+           values produced along the way. resume=True picks up from the stages 
+           checkpointed by a previous, interrupted run; otherwise any leftover 
+           checkpoints are discarded."""
+
+        self._check(set(initial))
+
+        values = dict(initial)
+        pending = list(self.stages)
+        running = {}
+        start = time.perf_counter()
+
+        if self.checkpoint_dir and resume:
+            checkpoints = self._load_checkpoints()
+            for stage in [stage for stage in pending if stage.name in checkpoints]:
+                pending.remove(stage)
+                values.update(checkpoints[stage.name])
+            print(f"StageGraph: resuming with {len(checkpoints)} of {len(self.stages)} stages already complete.")
+        else:
+            self.clear_checkpoints()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while pending or running:
+
+                for stage in [stage for stage in pending if all(name in values for name in stage.inputs)]:
+                    pending.remove(stage)
+                    inputs = {name: values[name] for name in stage.inputs}
+                    running[executor.submit(self._run_stage, stage, inputs)] = stage
+
+                if not running:
+                    # _check should have caught this - never spin waiting on nothing
+                    raise RuntimeError(f"StageGraph: {[stage.name for stage in pending]} are waiting on "
+                                       f"inputs no remaining stage will produce.")
+
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    running.pop(future)
+                    # a failed stage fails the run; stages already running finish first
+                    values.update(future.result())
+
+        self.report(time.perf_counter() - start)
+        return values
+
+    def report(self, total: float):
+
+        print(f"StageGraph: {len(self.timings)} stages finished in {total:.2f}s "
+              f"(sum of stage times {sum(self.timings.values()):.2f}s).")
+        for name, elapsed in sorted(self.timings.items(), key=lambda item: -item[1]):
+            print(f"    {name}: {elapsed:.2f}s")
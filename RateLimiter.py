@@ -0,0 +1,91 @@
+import time
+import asyncio
+from threading import Lock
+
+# requests per second allowed by each provider, and the burst a bucket can save up.
+# Last.fm asks for no more than 5/s per key, Ticketmaster's Discovery API allows 5/s;
+# Spotify uses an undocumented rolling 30s window, ~10/s sustained stays well under it
+DEFAULT_RATES = {"spotify": (10.0, 10),
+                 "lastfm": (5.0, 5),
+                 "ticketmaster": (5.0, 5)}
+
+
+class TokenBucket:
+
+    """Thread-safe token bucket. Each call to acquire() takes one token, waiting
+       for the bucket to refill if it is empty, so callers across every thread
+       (and the fetch engine's event loop) together never exceed rate requests
+       per second, with bursts of up to burst requests.
+
+       When a provider pushes back (HTTP 429 / Retry-After), block_for() holds
+       the whole bucket, not just the thread that got throttled."""
+
+    def __init__(self, rate: float, burst: int=1):
+
+        self.rate = rate
+        self.burst = burst
+
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.0
+        self.lock = Lock()
+
+    def _reserve(self) -> float:
+
+        """Takes a token (possibly going into debt) and returns how long the caller
+           has to wait before it may use it."""
+
+        with self.lock:
+            now = time.monotonic()
+            # during a block updated is in the future - nothing refills until it ends
+            self.tokens = min(self.burst, self.tokens + max(now - self.updated, 0.0) * self.rate)
+            self.updated = max(self.updated, now)
+            self.tokens -= 1
+
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+            return (self.updated - now) + wait
+
+    def acquire(self):
+
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def block_for(self, seconds: float):
+
+        """Stops handing out tokens for the next `seconds` seconds. The bucket starts
+           refilling (from empty) only when the block ends, so callers queued
+           behind it come out at rate, not all at once."""
+
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + max(now - self.updated, 0.0) * self.rate)
+            self.blocked_until = max(self.blocked_until, now + seconds)
+            self.updated = max(self.updated, self.blocked_until)
+            self.tokens = min(self.tokens, 0.0)
+
+
+def parse_retry_after(value, default: float) -> float:
+
+    """Retry-After is usually a number of seconds; fall back to default otherwise
+       (e.g. the HTTP-date form, or a missing header)."""
+
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+def make_limiters(rates: dict=None) -> dict:
+
+    """Builds one TokenBucket per provider from DEFAULT_RATES, overridden by
+       rates = {provider: (requests_per_second, burst)}."""
+
+    return {provider: TokenBucket(rate, burst)
+            for provider, (rate, burst) in {**DEFAULT_RATES, **(rates or {})}.items()}
@@ -0,0 +1,437 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from typing import List, Tuple
+from AtomicFile import atomic_path
+from FeatureStore import FeatureStore, NUMERIC_FEATURES, numeric_matrix
+from ArtistResolver import normalize_name
+from EdgeStore import EdgeStore
+from TagVectorizer import TagVectorizer
+
+# how much each block of features counts towards cosine similarity
+NUMERIC_WEIGHT = 0.5
+GENRE_WEIGHT = 1.0
+TAG_WEIGHT = 1.0
+# most frequent genres/tags kept as dimensions
+MAX_TERMS = 512
+
+# how strongly each relation type links two artists in the graph recommender,
+# after scaling each type's weights to at most 1. Tour and festival edges are
+# undirected, so walks follow them both ways
+RELATION_WEIGHTS = {"similarity": 1.0, "tour": 0.8, "festival": 0.4, "tag": 0.5}
+UNDIRECTED_RELATIONS = {"tour", "festival"}
+
+
+def _multi_hot(vectorizer: TagVectorizer, lists, max_terms: int) -> sp.csr_matrix:
+
+    """Sparse multi-hot matrix over the max_terms most frequent terms of vectorizer's
+       vocabulary (kept in vocabulary order). Terms not in the vocabulary are dropped."""
+
+    matrix = vectorizer.transform(lists)
+    document_counts = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    columns = np.sort(np.argsort(-document_counts, kind="stable")[:max_terms])
+
+    return sp.csr_matrix(matrix[:, columns])
+
+
+def _normalize_rows(matrix):
+
+    # dense or sparse - sparse rows stay sparse
+    if sp.issparse(matrix):
+        norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=1)).ravel())
+        return sp.csr_matrix(sp.diags(1.0 / np.where(norms > 0, norms, 1.0)) @ matrix)
+
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms > 0, norms, 1.0)
+
+
+def artist_vectors(features: pd.DataFrame, vectorizer: TagVectorizer=None) -> sp.csr_matrix:
+
+    """One unit vector per artist (a CSR row): log-scaled, standardized numeric
+       features plus multi-hot genres and Lastfm tags, each block normalized and
+       weighted so the dot product of two vectors is a blended cosine similarity.
+       Genres and tags are encoded with vectorizer (the pipeline's vocabulary),
+       which is left unchanged; without one, a vocabulary is built from features."""
+
+    if vectorizer is None or len(vectorizer) == 0:
+        vectorizer = TagVectorizer()
+        vectorizer.fit_transform(features["genres"], features["lastfm_tags"])
+    blocks = [sp.csr_matrix(NUMERIC_WEIGHT * _normalize_rows(numeric_matrix(features)))]
+    for column, weight in [("genres", GENRE_WEIGHT), ("lastfm_tags", TAG_WEIGHT)]:
+        blocks.append(weight * _normalize_rows(_multi_hot(vectorizer, features[column], MAX_TERMS)))
+
+    return sp.csr_matrix(_normalize_rows(sp.hstack(blocks, format="csr")), dtype=np.float32)
+
+
+class IVFIndex:
+
+    """Inverted-file approximate nearest-neighbour index over unit vectors (rows of
+       a dense array or a CSR matrix).
+
+       build() clusters the vectors with a few rounds of k-means and stores them
+       grouped by cluster (vectors[offsets[c]:offsets[c + 1]] is cluster c). A
+       search scores the query against the centroids, then exhaustively against
+       the members of the n_probe closest clusters only - so a query touches
+       about n_probe / n_lists of the data instead of all of it."""
+
+    def __init__(self, n_lists: int=None, n_probe: int=8):
+
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+
+        self.centroids = None
+        self.vectors = None
+        self.ids = None
+        self.offsets = None
+
+    def build(self, vectors, iterations: int=10, seed: int=0):
+
+        rng = np.random.default_rng(seed)
+        n = vectors.shape[0]
+        # ~sqrt(n) lists is the usual balance between centroid and list scans
+        n_lists = min(self.n_lists or max(1, int(np.sqrt(n))), n)
+
+        centroids = vectors[rng.choice(n, n_lists, replace=False)]
+        centroids = centroids.toarray() if sp.issparse(centroids) else centroids.copy()
+        for _ in range(iterations):
+            assignment = np.argmax(vectors @ centroids.T, axis=1)
+            # sum of each cluster's vectors, as one (sparse) product
+            members = sp.csr_matrix((np.ones(n, dtype=np.float32), (assignment, np.arange(n))), shape=(n_lists, n))
+            sums = members @ vectors
+            sums = sums.toarray() if sp.issparse(sums) else sums
+            counts = np.bincount(assignment, minlength=n_lists)
+            # empty clusters keep their old centroid
+            centroids = np.where(counts[:, None] > 0, _normalize_rows(sums), centroids)
+
+        assignment = np.argmax(vectors @ centroids.T, axis=1)
+        order = np.argsort(assignment, kind="stable")
+
+        self.centroids = centroids.astype(np.float32)
+        self.vectors = vectors[order]
+        self.ids = order.astype(np.int64)
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=n_lists))]).astype(np.int64)
+        return self
+
+    def search(self, query: np.ndarray, k: int=10, exclude=(), n_probe: int=None) -> List[Tuple[int, float]]:
+
+        """[(row id, similarity), ...] of the (approximately) k most similar vectors,
+           skipping the row ids in exclude."""
+
+        n_probe = min(n_probe or self.n_probe, len(self.centroids))
+        probed = np.argpartition(-(self.centroids @ query), n_probe - 1)[:n_probe]
+
+        rows = np.concatenate([np.arange(self.offsets[c], self.offsets[c + 1]) for c in probed])
+        scores = self.vectors[rows] @ query
+        ids = self.ids[rows]
+
+        keep = ~np.isin(ids, np.fromiter(exclude, dtype=np.int64))
+        ids, scores = ids[keep], scores[keep]
+        top = np.argsort(-scores)[:k]
+
+        return [(int(ids[i]), float(scores[i])) for i in top]
+
+    def save(self, path: str, **extra):
+
+        # sparse vectors are saved as their CSR arrays
+        if sp.issparse(self.vectors):
+            vectors = {"vectors_data": self.vectors.data, "vectors_indices": self.vectors.indices,
+                       "vectors_indptr": self.vectors.indptr, "vectors_shape": np.array(self.vectors.shape)}
+        else:
+            vectors = {"vectors": self.vectors}
+
+        with atomic_path(path) as tmp_path, open(tmp_path, "wb") as f:
+            np.savez(f, centroids=self.centroids, ids=self.ids, offsets=self.offsets, n_probe=self.n_probe,
+                     **vectors, **extra)
+
+    @classmethod
+    def load(cls, path: str):
+
+        with np.load(path, allow_pickle=False) as data:
+            index = cls(n_lists=len(data["centroids"]), n_probe=int(data["n_probe"]))
+            index.centroids, index.ids, index.offsets = data["centroids"], data["ids"], data["offsets"]
+            if "vectors" in data.files:
+                index.vectors = data["vectors"]
+            else:
+                index.vectors = sp.csr_matrix((data["vectors_data"], data["vectors_indices"], data["vectors_indptr"]),
+                                              shape=tuple(data["vectors_shape"]))
+            extra = {key: data[key] for key in data.files
+                     if key not in ("centroids", "vectors", "vectors_data", "vectors_indices", "vectors_indptr",
+                                    "vectors_shape", "ids", "offsets", "n_probe")}
+
+        return index, extra
+
+
+class ArtistRecommender:
+
+    """Top-k "artists you should look into" for a set of seed artists, by
+       nearest neighbours of the seeds' average feature vector (artist_vectors)
+       in an IVFIndex.
+
+       The index is built once from the feature table and persisted next to it
+       (index_path), along with the artist names and playlist flags; it is
+       rebuilt only when the feature table is newer than the index, so a query
+       costs a load and a few small matrix products. Genres and tags are
+       encoded with the pipeline's vocabulary (<features>.vocab.json) if there
+       is one, as in HeteroGraph.load."""
+
+    def __init__(self, features_path: str, index_path: str=None, n_lists: int=None, n_probe: int=8,
+                 vocabulary_path: str=None):
+
+        self.feature_store = FeatureStore(features_path)
+        self.index_path = index_path or os.path.splitext(features_path)[0] + ".index.npz"
+        self.vocabulary_path = vocabulary_path or os.path.splitext(features_path)[0] + ".vocab.json"
+        self.n_lists = n_lists
+        self.n_probe = n_probe
+
+        self.index = None
+        self.names = None
+        self.in_playlist = None
+        self.rows = {}
+
+    def _is_stale(self) -> bool:
+
+        return (not os.path.exists(self.index_path)
+                or os.path.getmtime(self.index_path) < os.path.getmtime(self.feature_store.path))
+
+    def build(self):
+
+        start = time.time()
+        features = self.feature_store.read(["name"] + NUMERIC_FEATURES + ["genres", "lastfm_tags"])
+        vectors = artist_vectors(features, TagVectorizer(self.vocabulary_path))
+
+        self.index = IVFIndex(self.n_lists, self.n_probe).build(vectors)
+        self.names = np.array(features["name"].astype(str).tolist(), dtype=str)
+        self.in_playlist = features["playlist_count"].fillna(0).to_numpy() > 0
+        self.index.save(self.index_path, names=self.names, in_playlist=self.in_playlist)
+        self.rows = {name: i for i, name in enumerate(self.names)}
+
+        print(f"ArtistRecommender: indexed {len(self.names)} artists in {len(self.index.centroids)} lists "
+              f"({time.time() - start:.2f}s), saved to {self.index_path}.")
+
+    def load(self):
+
+        """Loads the persisted index, (re)building it first if it is missing or out of date."""
+
+        if self._is_stale():
+            self.build()
+            return
+
+        self.index, extra = IVFIndex.load(self.index_path)
+        self.index.n_probe = self.n_probe
+        self.names, self.in_playlist = list(extra["names"]), extra["in_playlist"]
+        self.rows = {name: i for i, name in enumerate(self.names)}
+
+    def recommend(self, seeds: List[str]=None, k: int=20, include_playlist: bool=False) -> List[Tuple[str, float]]:
+
+        """[(artist, similarity), ...] of the k artists closest to the seeds (by
+           default, every playlist artist). Seeds are never recommended, nor -
+           unless include_playlist - anything already on the playlist."""
+
+        if self.index is None:
+            self.load()
+
+        if seeds is None:
+            seed_rows = np.flatnonzero(self.in_playlist)
+        else:
+            # feature rows are keyed on normalized names, so any spelling of a seed works
+            found = {seed: self.rows.get(seed, self.rows.get(normalize_name(seed))) for seed in seeds}
+            missing = [seed for seed, row in found.items() if row is None]
+            if missing:
+                print(f"ArtistRecommender: no features for {missing}, skipping them.")
+            seed_rows = np.array([row for row in found.values() if row is not None], dtype=np.int64)
+        if len(seed_rows) == 0:
+            return []
+
+        # the index stores vectors grouped by list, so look the seeds' up by row id
+        positions = np.empty(len(self.index.ids), dtype=np.int64)
+        positions[self.index.ids] = np.arange(len(self.index.ids))
+        seed_vectors = self.index.vectors[positions[seed_rows]]
+        query = _normalize_rows(np.asarray(seed_vectors.mean(axis=0)).reshape(1, -1))[0]
+
+        exclude = set(seed_rows.tolist())
+        if not include_playlist:
+            exclude.update(np.flatnonzero(self.in_playlist).tolist())
+
+        return [(str(self.names[i]), score) for i, score in self.index.search(query, k, exclude)]
+
+
+def transition_matrix(graph, relation_weights: dict=None) -> sp.csr_matrix:
+
+    """Row-stochastic (n, n) random walk matrix over an EdgeGraph: the relation
+       types' CSR arrays, each scaled by its weight in relation_weights
+       (RELATION_WEIGHTS by default; missing types are dropped), summed, and
+       normalized by out-degree. Rows of nodes with no out-edges stay empty."""
+
+    relation_weights = RELATION_WEIGHTS if relation_weights is None else relation_weights
+    n = len(graph.names)
+
+    adjacency = sp.csr_matrix((n, n), dtype=np.float64)
+    for relation in graph.relations:
+        if not relation_weights.get(relation):
+            continue
+        indptr, indices, weights = graph.csr[relation]
+        if len(weights) == 0:
+            continue
+        # festival weights are counts, similarity scores are <= 1 - put them on the same scale.
+        # the EdgeStore arrays are read-only memory maps, and scipy sorts indices in place
+        scaled = np.asarray(weights, dtype=np.float64) * (relation_weights[relation] / max(weights.max(), 1e-12))
+        matrix = sp.csr_matrix((scaled, np.array(indices), np.array(indptr)), shape=(n, n))
+        if relation in UNDIRECTED_RELATIONS:
+            matrix = matrix + matrix.T
+        adjacency = adjacency + matrix
+
+    out_degree = np.asarray(adjacency.sum(axis=1)).ravel()
+    scale = np.divide(1.0, out_degree, out=np.zeros(n), where=out_degree > 0)
+
+    return sp.csr_matrix(sp.diags(scale) @ adjacency)
+
+
+def personalized_pagerank(transition: sp.csr_matrix, restart: np.ndarray, alpha: float=0.85,
+                          scores: np.ndarray=None, tol: float=1e-8, max_iter: int=200):
+
+    """Random walk with restart: the stationary distribution of a walk that follows
+       transition with probability alpha and jumps back to the restart
+       distribution otherwise (and whenever it reaches a node with no
+       out-edges). Power iteration, starting from scores if given (e.g. the
+       previous result for a slightly changed graph or playlist), and stopping
+       once an iteration changes the scores by less than tol (L1) - at
+       alpha=0.85 a cold start can take ~100 iterations to get to 1e-8. Returns
+       (scores, iterations run); hitting max_iter first is reported."""
+
+    restart = restart / restart.sum()
+    scores = restart.copy() if scores is None else scores / scores.sum()
+    # iterate on the transpose so each step is one sparse matrix-vector product
+    walk = sp.csr_matrix(transition.T)
+    dangling = np.asarray(transition.sum(axis=1)).ravel() == 0
+
+    for iteration in range(1, max_iter + 1):
+        updated = alpha * (walk @ scores) + (alpha * scores[dangling].sum() + 1 - alpha) * restart
+        change = np.abs(updated - scores).sum()
+        scores = updated
+        if change < tol:
+            break
+    else:
+        print(f"personalized_pagerank: not converged after {max_iter} iterations "
+              f"(last change {change:.2e}, tol {tol:.0e}).")
+
+    return scores, iteration
+
+
+class GraphRecommender:
+
+    """Recommends artists by personalized PageRank (random walk with restart) from
+       the seed artists over the relationships graph (EdgeStore), with the
+       relation types weighted by relation_weights.
+
+       The last score vector is saved to scores_path, keyed by artist name, and
+       the next ranking starts its power iteration from it - after an
+       incremental refresh or a small playlist change, that takes a handful of
+       iterations instead of dozens."""
+
+    def __init__(self, edges_path: str, scores_path: str=None, relation_weights: dict=None,
+                 alpha: float=0.85, tol: float=1e-8):
+
+        self.edge_store = EdgeStore(edges_path)
+        self.scores_path = scores_path or os.path.splitext(edges_path)[0] + ".pagerank.npz"
+        self.relation_weights = relation_weights
+        self.alpha = alpha
+        self.tol = tol
+
+        self.graph = None
+        self.transition = None
+
+    def load(self):
+
+        self.graph = self.edge_store.read()
+        self.transition = transition_matrix(self.graph, self.relation_weights)
+
+    def _previous_scores(self) -> np.ndarray:
+
+        if not os.path.exists(self.scores_path):
+            return None
+
+        with np.load(self.scores_path, allow_pickle=False) as previous:
+            names, scores = previous["names"], previous["scores"]
+
+        # carry scores over by name - node IDs shift whenever the graph changes
+        ids = self.graph.ids
+        matched = np.array([ids.get(name, -1) for name in names], dtype=np.int64)
+        warm = np.zeros(len(self.graph.names))
+        warm[matched[matched >= 0]] = scores[matched >= 0]
+
+        return warm if warm.sum() > 0 else None
+
+    def _save_scores(self, scores: np.ndarray):
+
+        with atomic_path(self.scores_path) as tmp_path, open(tmp_path, "wb") as f:
+            np.savez(f, names=np.array(self.graph.names, dtype=str), scores=scores)
+
+    def scores(self, seeds: List[str], warm_start: bool=True) -> np.ndarray:
+
+        """PageRank score of every node (in graph.names order) for the seed artists."""
+
+        if self.graph is None:
+            self.load()
+
+        ids = self.graph.ids
+        found = {seed: ids.get(seed, ids.get(normalize_name(seed))) for seed in seeds}
+        missing = [seed for seed, i in found.items() if i is None]
+        if missing:
+            print(f"GraphRecommender: {missing} not in the graph, skipping them.")
+
+        restart = np.zeros(len(self.graph.names))
+        restart[[i for i in found.values() if i is not None]] = 1.0
+        if restart.sum() == 0:
+            return np.zeros(len(self.graph.names))
+
+        start = time.time()
+        scores, iterations = personalized_pagerank(self.transition, restart, self.alpha,
+                                                   self._previous_scores() if warm_start else None, self.tol)
+        print(f"GraphRecommender: ranked {len(scores)} artists in {iterations} iterations "
+              f"({1000 * (time.time() - start):.1f}ms).")
+
+        self._save_scores(scores)
+        return scores
+
+    def recommend(self, seeds: List[str], k: int=20, exclude: List[str]=(), warm_start: bool=True) -> List[Tuple[str, float]]:
+
+        """[(artist, score), ...] of the k highest-ranked artists that are not seeds
+           (or in exclude - e.g. the rest of the playlist)."""
+
+        scores = self.scores(seeds, warm_start).copy()
+        ids = self.graph.ids
+        for name in list(seeds) + list(exclude):
+            i = ids.get(name, ids.get(normalize_name(name)))
+            if i is not None:
+                scores[i] = -np.inf
+
+        top = np.argsort(-scores)[:k]
+        return [(self.graph.names[i], float(scores[i])) for i in top if np.isfinite(scores[i]) and scores[i] > 0]
+
+
+if __name__ == "__main__":
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("features", help="feature table written by DataPipeline.py (.parquet)")
+    parser.add_argument("seeds", nargs="*", help="artists to recommend from (default: the whole playlist)")
+    parser.add_argument("-k", type=int, default=20, help="number of artists to recommend")
+    parser.add_argument("--rebuild", action="store_true", help="rebuild the index even if it is up to date")
+    parser.add_argument("--graph", metavar="EDGES", default=None,
+                        help="rank by personalized PageRank over this relationships file (.edges) instead")
+    args = parser.parse_args()
+
+    recommender = ArtistRecommender(args.features)
+    recommender.build() if args.rebuild else recommender.load()
+
+    start = time.time()
+    if args.graph:
+        playlist = [str(name) for name in np.array(recommender.names)[recommender.in_playlist]]
+        recommendations = GraphRecommender(args.graph).recommend(args.seeds or playlist, args.k, exclude=playlist)
+    else:
+        recommendations = recommender.recommend(args.seeds or None, args.k)
+    print(f"Recommender: {len(recommendations)} recommendations in {1000 * (time.time() - start):.1f}ms.")
+    for rank, (name, score) in enumerate(recommendations, 1):
+        print(f"{rank:3d}. {name} ({score:.4f})")
@@ -0,0 +1,184 @@
+import os
+import sys
+import json
+import unicodedata
+import numpy as np
+import scipy.sparse as sp
+from typing import List
+from AtomicFile import atomic_path
+
+
+def canonical_tag(tag: str) -> str:
+
+    """Canonical form of a genre or tag: accents stripped, casefolded, and hyphens,
+       underscores and runs of whitespace collapsed to one space - so "DJENT" and
+       "djent", "Post-Hardcore" and "post hardcore" are one term."""
+
+    decomposed = unicodedata.normalize("NFKD", str(tag))
+    tag = "".join(char for char in decomposed if not unicodedata.combining(char)).casefold()
+
+    return " ".join(tag.replace("-", " ").replace("_", " ").split())
+
+
+def _terms(value) -> list:
+
+    # list columns come back from FeatureStore.read as NumPy arrays, or None
+    if value is None or isinstance(value, (str, float)):
+        return []
+
+    return list(value)
+
+
+class TagVectorizer:
+
+    """Multi-hot encoder for genre and tag lists, with a persistent vocabulary.
+
+       Every canonical term (canonical_tag) gets a column ID the first time it is
+       seen, and keeps it - the vocabulary only ever grows, so matrices encoded
+       before new artists arrived stay valid (just narrower), and re-encoding
+       the same artists gives the same columns.
+
+       transform() encodes any number of list columns (a row's terms are the
+       union of its lists) straight into a CSR matrix in one pass over the rows.
+       With path set, the vocabulary is loaded from and saved to that JSON file."""
+
+    def __init__(self, path: str=None):
+
+        self.path = path
+        # term -> column
+        self.vocabulary = {}
+
+        if path and os.path.exists(path):
+            self.load()
+
+    def __len__(self) -> int:
+
+        return len(self.vocabulary)
+
+    @property
+    def terms(self) -> List[str]:
+
+        """Terms in column order."""
+
+        return list(self.vocabulary)
+
+    def load(self):
+
+        with open(self.path) as f:
+            saved = json.load(f)
+
+        self.vocabulary = {term: i for i, term in enumerate(saved["terms"])}
+
+    def save(self, path: str=None):
+
+        path = path or self.path
+        with atomic_path(path) as tmp_path, open(tmp_path, "w") as f:
+            json.dump({"terms": self.terms}, f)
+
+        print(f"TagVectorizer: {len(self)} terms saved to {path}.")
+
+    def transform(self, *columns, grow: bool=False) -> sp.csr_matrix:
+
+        """(rows, len(vocabulary)) CSR matrix with a 1 for every term of every row.
+           Each column is a sequence of term lists, one per row. With grow, unseen
+           terms are added to the vocabulary; otherwise they are dropped."""
+
+        indptr = [0]
+        indices = []
+        # the same few spellings repeat across artists - canonicalize each once
+        canonical = {}
+        for lists in zip(*columns):
+            row = set()
+            for value in lists:
+                for term in _terms(value):
+                    if term not in canonical:
+                        canonical[term] = canonical_tag(term)
+                    term = canonical[term]
+                    column = self.vocabulary.get(term)
+                    if column is None:
+                        if not grow or not term:
+                            continue
+                        column = self.vocabulary[term] = len(self.vocabulary)
+                    row.add(column)
+
+            indices.extend(sorted(row))
+            indptr.append(len(indices))
+
+        data = np.ones(len(indices), dtype=np.float32)
+        return sp.csr_matrix((data, np.array(indices, dtype=np.int32), np.array(indptr, dtype=np.int64)),
+                             shape=(len(indptr) - 1, len(self)))
+
+    def fit_transform(self, *columns) -> sp.csr_matrix:
+
+        """transform(), growing the vocabulary with any new terms - for new artists."""
+
+        return self.transform(*columns, grow=True)
+
+
+def tag_similarity(matrix: sp.csr_matrix, k: int=10, min_similarity: float=0.0,
+                   max_document_frequency: float=1.0, block_cells: int=2 ** 24):
+
+    """Top-k most similar rows for every row of a multi-hot matrix, by TF-IDF cosine
+       similarity - sharing a rare tag counts for more than sharing "metal".
+       Computed as a sparse product of the normalized matrix with its transpose,
+       a block of rows at a time (at most block_cells similarities in memory at
+       once), keeping only the k best pairs per row with a similarity of at
+       least min_similarity. Returns (rows, columns, similarities) arrays,
+       without self-pairs.
+
+       Terms on more than max_document_frequency of the rows (e.g. "metal" in a
+       metal crawl) are left out: they say little about any one pair, but make
+       nearly every pair a candidate, and the product close to dense."""
+
+    n = matrix.shape[0]
+    k = min(k, n - 1)
+    if k < 1:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.float32)
+
+    document_counts = np.bincount(matrix.indices, minlength=matrix.shape[1])
+    idf = np.log((1 + n) / (1 + document_counts)) + 1
+    idf[document_counts > max_document_frequency * n] = 0.0
+
+    weighted = sp.csr_matrix(matrix.multiply(idf[None, :]), dtype=np.float32)
+    weighted.eliminate_zeros()
+    norms = np.sqrt(np.asarray(weighted.multiply(weighted).sum(axis=1)).ravel())
+    weighted = sp.csr_matrix(sp.diags(np.divide(1.0, norms, out=np.zeros(n), where=norms > 0)) @ weighted,
+                             dtype=np.float32)
+    weighted_t = sp.csc_matrix(weighted.T)
+
+    # a block of rows at a time bounds the size of the product, even if it is dense
+    block_size = max(1, block_cells // n)
+    rows, columns, similarities = [], [], []
+    for start in range(0, n, block_size):
+        block = sp.csr_matrix(weighted[start:start + block_size] @ weighted_t)
+        block_rows = np.repeat(np.arange(start, start + block.shape[0]), np.diff(block.indptr))
+        keep = (block_rows != block.indices) & (block.data >= min_similarity) & (block.data > 0)
+        block_rows, block_columns, data = block_rows[keep], block.indices[keep], block.data[keep]
+
+        # one sort for the whole block - by row, then by descending similarity (in [0, 1]) -
+        # and the first k of every row are kept
+        order = np.argsort(block_rows + 0.5 * (1.0 - data.astype(np.float64)), kind="stable")
+        block_rows, block_columns, data = block_rows[order], block_columns[order], data[order]
+        top = np.arange(len(block_rows)) - np.searchsorted(block_rows, block_rows) < k
+
+        rows.append(block_rows[top])
+        columns.append(block_columns[top])
+        similarities.append(data[top])
+
+    return np.concatenate(rows), np.concatenate(columns), np.concatenate(similarities)
+
+
+if __name__ == "__main__":
+
+    # build or extend a vocabulary: python TagVectorizer.py features.parquet [vocabulary.json]
+    from FeatureStore import FeatureStore
+
+    features_path = sys.argv[1]
+    vocabulary_path = sys.argv[2] if len(sys.argv) > 2 else os.path.splitext(features_path)[0] + ".vocab.json"
+
+    features = FeatureStore(features_path).read(["name", "genres", "lastfm_tags"])
+    vectorizer = TagVectorizer(vocabulary_path)
+    known = len(vectorizer)
+    matrix = vectorizer.fit_transform(features["genres"], features["lastfm_tags"])
+    print(f"TagVectorizer: {matrix.shape[0]} artists, {matrix.nnz} tags, {len(vectorizer) - known} new terms.")
+    vectorizer.save()
@@ -0,0 +1,85 @@
+"""Benchmarks the similar-artist and event fan-out against a local stub server
+   that answers every request after a fixed delay, compared with fetching the
+   same artists one at a time (what the old submit-one-then-wait loops did).
+
+   Usage: python benchmarks/bench_fanout.py [n_artists] [delay_seconds]"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from DataPipeline import FeatureExtractor
+
+
+class SlowHandler(BaseHTTPRequestHandler):
+
+    protocol_version = "HTTP/1.1"
+    delay = 0.1
+
+    def do_GET(self):
+
+        time.sleep(self.delay)
+        if self.path.startswith("/lastfm"):
+            payload = {"similarartists": {"artist": [{"name": "Stub Artist", "match": "0.5"}]}}
+        else:
+            payload = {"_embedded": {"events": []}}
+
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def main(n_artists: int=100, delay: float=0.1):
+
+    SlowHandler.delay = delay
+    server = ThreadingHTTPServer(("127.0.0.1", 0), SlowHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    root = f"http://127.0.0.1:{server.server_port}"
+
+    # fresh cache dir so nothing is served from cache
+    os.chdir(tempfile.mkdtemp())
+    FeatureExtractor.LASTFM_URL = f"{root}/lastfm"
+    FeatureExtractor.DISCOVERY_URL = f"{root}/discovery"
+    extractor = FeatureExtractor(spotify_client_id="stub", spotify_client_secret="stub", 
+                                 playlist_url="", lastfm_api_key="stub", lastfm_username="stub", 
+                                 discovery_api_key="stub", features_filename="features.parquet", 
+                                 # measure the fan-out itself, not the providers' rate limits
+                                 rate_limits={"lastfm": (1000.0, 1000), "ticketmaster": (1000.0, 1000)})
+    names = [f"artist {i}" for i in range(n_artists)]
+
+    start = time.perf_counter()
+    for name in names:
+        extractor.http.get_json(extractor.LASTFM_URL, {"artist": name})
+    serial = time.perf_counter() - start
+
+    start = time.perf_counter()
+    extractor._get_similar_artists(names)
+    similar = time.perf_counter() - start
+
+    start = time.perf_counter()
+    extractor._get_artist_events(names)
+    events = time.perf_counter() - start
+
+    print(f"\n{n_artists} artists, {delay}s per request")
+    print(f"serial:                {serial:.2f}s")
+    print(f"_get_similar_artists:  {similar:.2f}s ({serial / similar:.1f}x)")
+    print(f"_get_artist_events:    {events:.2f}s ({serial / events:.1f}x)")
+
+    extractor.close()
+    server.shutdown()
+
+
+if __name__ == "__main__":
+
+    main(*[cast(arg) for cast, arg in zip((int, float), sys.argv[1:])])
@@ -1,57 +1,183 @@
-import json
+import numpy as np
 import pandas as pd
 import networkx as nx
 import matplotlib.pyplot as plt
+from FeatureStore import FeatureStore
+from EdgeStore import EdgeStore
+from Layout import force_layout, warm_start, graph_hash, LayoutCache, top_k, render_image, export_json
     
 TOP_N_ARTISTS= None
 NODE_SIZE = 300
 FONT_SIZE = 8
 FIGURE_SIZE = (20, 20)
 
-with open("/home/jasmine/PROJECTS/riffnet/artist_relationships.json", "r") as f:
-    edges = json.load(f)
+# past this many artists, skip networkx/spring_layout and use the large graph mode: 
+# a grid-approximated force layout (cached per graph), only the heaviest 
+# MAX_EDGES_DRAWN edges and MAX_LABELS best-connected names drawn, saved to 
+# LARGE_GRAPH_IMAGE, and optionally exported as WebGL-ready JSON (e.g. for sigma.js)
+LARGE_GRAPH_NODES = 1000
+LAYOUT_ITERATIONS = 50
+MAX_EDGES_DRAWN = 20000
+MAX_LABELS = 100
+LAYOUT_CACHE_DIR = "/home/jasmine/PROJECTS/riffnet/cache/layouts"
+LARGE_GRAPH_IMAGE = "/home/jasmine/PROJECTS/riffnet/artist_relationships.png"
+GRAPH_JSON = None
+
+# layouts are kept in LAYOUT_CACHE_DIR; when the graph has changed since the last
+# one (e.g. after an incremental refresh), known artists keep their positions, new
+# ones are placed next to their neighbours, and only REFINE_ITERATIONS are run -
+# unless more than MAX_NEW_FRACTION of the artists are new (e.g. TOP_N_ARTISTS
+# changed), in which case a few refining steps can't untangle them and the
+# layout is computed from scratch
+REFINE_ITERATIONS = 10
+MAX_NEW_FRACTION = 0.3
+
+# old JSON outputs can be converted with python EdgeStore.py artist_relationships.json
+edges = EdgeStore("/home/jasmine/PROJECTS/riffnet/artist_relationships.edges").read().to_frame()
 
 try:
-    features_df = pd.read_csv("/home/jasmine/PROJECTS/riffnet/ALL_FEATURES_1010.csv")
-    top_artists = set(features_df.nlargest(TOP_N_ARTISTS, "popularity")["name"]) if TOP_N_ARTISTS else None
+    # only the two columns needed here are read; old CSV outputs can be converted 
+    # with python FeatureStore.py ALL_FEATURES_1010.csv
+    features_df = FeatureStore("/home/jasmine/PROJECTS/riffnet/ALL_FEATURES_1010.parquet").read(["name", "popularity"])
+    top_artists = features_df.nlargest(TOP_N_ARTISTS, "popularity")["name"] if TOP_N_ARTISTS else None
 except FileNotFoundError:
     top_artists = None
 
-G = nx.DiGraph()  # Use DiGraph for similarity (asymmetric), will handle tour/festival as undirected\n",
-for edge in edges:
-    source = edge["origin"]
-    target = edge["target"]
-    edge_type = edge["type"]
-    weight = edge["weight"]
-    if top_artists and (source not in top_artists or target not in top_artists):
-        continue
-    # For tour and festival edges, add both directions to simulate undirected edges\n",
-    if edge_type in ["tour", "festival"]:
-        G.add_edge(source, target, type=edge_type, weight=weight, **{k: v for k, v in edge.items() if k not in ["origin", "target", "type", "weight"]})
-        G.add_edge(target, source, type=edge_type, weight=weight, **{k: v for k, v in edge.items() if k not in ["origin", "target", "type", "weight"]})
-    else:  # Similarity edges are directed\n",
-        G.add_edge(source, target, type=edge_type, weight=weight)
-
-print(f"Graph created with {G.number_of_nodes()} nodes and {G.number_of_edges()} edges.")
-
 edge_colors = {"similarity": "blue",
                "tour": "red",
-               "festival": "green"}
-
-edge_widths = [G[u][v]["weight"] * 2 for u, v in G.edges()]  # Scale weight for visibility\n",
-edge_colors_list = [edge_colors[G[u][v]["type"]] for u, v in G.edges()]
-
-pos = nx.spring_layout(G, k=0.5, iterations=50)
-plt.figure(figsize=FIGURE_SIZE)
-nx.draw_networkx_nodes(G, pos, node_size=NODE_SIZE, node_color="lightblue"),
-nx.draw_networkx_edges(G, pos, edge_color=edge_colors_list, width=edge_widths, alpha=0.7)
-nx.draw_networkx_labels(G, pos, font_size=FONT_SIZE)
-plt.title("Artist Relationships Network\n(Blue: Similarity, Red: Tour, Green: Festival)")
-plt.axis("off")
-
-from matplotlib.lines import Line2D
-legend_elements = [Line2D([0], [0], color="blue", lw=2, label="Similarity"),
-                   Line2D([0], [0], color="red", lw=2, label="Tour"),
-                   Line2D([0], [0], color="green", lw=2, label="Festival")]
-plt.legend(handles=legend_elements, loc="upper right")
-plt.show()
\ No newline at end of file
+               "festival": "green",
+               "tag": "purple"}
+
+def graph_edge_frame(edges: pd.DataFrame, top_artists=None) -> pd.DataFrame:
+
+    """The edges of the artist graph (origin, target, type, weight), one per 
+       directed pair, restricted to top_artists if given."""
+
+    if top_artists is not None:
+        edges = edges[edges["origin"].isin(top_artists) & edges["target"].isin(top_artists)]
+
+    # DiGraph for similarity (asymmetric); tour and festival edges are undirected, so
+    # they go in both directions
+    edges = edges.reset_index(drop=True)
+    undirected = edges["type"].isin(["tour", "festival"])
+    reversed_edges = edges[undirected].rename(columns={"origin": "target", "target": "origin"})
+    # each reversed edge goes right after its original, as if both were added in turn
+    edges = pd.concat([edges, reversed_edges]).sort_index(kind="stable").reset_index(drop=True)
+    # a DiGraph holds one edge per (origin, target) - as with repeated add_edge calls, the last one wins
+    return edges.drop_duplicates(subset=["origin", "target"], keep="last")
+
+def build_graph(graph_edges: pd.DataFrame):
+
+    """Builds the artist graph from graph_edge_frame's edges in one bulk insert; 
+       its edges stay row-aligned with the frame for styling."""
+
+    return nx.from_pandas_edgelist(graph_edges, source="origin", target="target", 
+                                   edge_attr=["type", "weight"], create_using=nx.DiGraph)
+
+def edge_arrays(graph_edges: pd.DataFrame):
+
+    """Node names (sorted) and the edges as (source, target, weight) arrays of node indices."""
+
+    codes, names = pd.factorize(pd.concat([graph_edges["origin"], graph_edges["target"]]), sort=True)
+    return list(names), codes[:len(graph_edges)], codes[len(graph_edges):], graph_edges["weight"].to_numpy(dtype=float)
+
+def cached_layout(names, sources, targets, weights, mode: str, layout, refine) -> np.ndarray:
+
+    """Positions for every node, in names order. The same graph gets the same cached 
+       layout back; a changed graph is warm-started from the latest layout of the 
+       same mode and only refined (refine(initial positions, new node mask)); 
+       layout() is called when there is nothing to start from, or when more than 
+       MAX_NEW_FRACTION of the nodes would be new."""
+
+    # same graph, same parameters -> same layout, so it is only ever computed once
+    layout_cache = LayoutCache(LAYOUT_CACHE_DIR)
+    key = graph_hash(names, sources, targets, weights, iterations=LAYOUT_ITERATIONS, mode=mode)
+    pos = layout_cache.get(key)
+    if pos is not None:
+        return pos
+
+    pos = None
+    previous = layout_cache.latest(mode)
+    if previous is not None:
+        initial, new = warm_start(names, sources, targets, *previous)
+        if new.mean() <= MAX_NEW_FRACTION:
+            print(f"cached_layout: {new.sum()} new artists placed into the previous layout of {len(previous[0])}.")
+            pos = refine(initial, new)
+        else:
+            print(f"cached_layout: {new.sum()} of {len(names)} artists are new, laying out from scratch.")
+    if pos is None:
+        pos = layout()
+
+    layout_cache.put(key, names, pos, mode)
+    return pos
+
+def draw_large_graph(graph_edges: pd.DataFrame):
+
+    """Large graph mode - everything from arrays, no networkx."""
+
+    names, sources, targets, weights = edge_arrays(graph_edges)
+    print(f"Graph created with {len(names)} nodes and {len(graph_edges)} edges.")
+
+    def refine(initial, new):
+        # a low temperature nudges the known artists instead of reshuffling them
+        extent = np.ptp(initial, axis=0).max()
+        return force_layout(len(names), sources, targets, weights, iterations=REFINE_ITERATIONS, 
+                            pos=initial, temperature=0.02 * extent)
+
+    pos = cached_layout(names, sources, targets, weights, "large", 
+                        lambda: force_layout(len(names), sources, targets, weights, iterations=LAYOUT_ITERATIONS), 
+                        refine)
+
+    # level of detail - node size by degree, only the heaviest edges and best-connected labels
+    degree = np.bincount(np.concatenate([sources, targets]), minlength=len(names))
+    node_sizes = 5 + 50 * degree / degree.max()
+    drawn = top_k(weights, MAX_EDGES_DRAWN)
+    labels = {i: names[i] for i in top_k(degree, MAX_LABELS)}
+    colors = graph_edges["type"].map(edge_colors).fillna("gray").to_numpy()
+
+    render_image(LARGE_GRAPH_IMAGE, pos, sources[drawn], targets[drawn], colors[drawn], 
+                 0.2 + weights[drawn] / weights.max(), labels=labels, node_sizes=node_sizes, 
+                 figure_size=FIGURE_SIZE, title="Artist Relationships Network", legend=edge_colors)
+    if GRAPH_JSON:
+        export_json(GRAPH_JSON, names, pos, sources, targets, graph_edges["type"], weights, 
+                    node_sizes=node_sizes, edge_colors=colors)
+
+graph_edges = graph_edge_frame(edges, top_artists)
+if pd.concat([graph_edges["origin"], graph_edges["target"]]).nunique() > LARGE_GRAPH_NODES:
+    draw_large_graph(graph_edges)
+else:
+    G = build_graph(graph_edges)
+    print(f"Graph created with {G.number_of_nodes()} nodes and {G.number_of_edges()} edges.")
+
+    # styling straight from the edge frame, drawn in the frame's order
+    edge_list = list(zip(graph_edges["origin"], graph_edges["target"]))
+    edge_widths = (graph_edges["weight"] * 2).to_numpy()  # Scale weight for visibility
+    edge_colors_list = graph_edges["type"].map(edge_colors).to_numpy()
+
+    names, sources, targets, weights = edge_arrays(graph_edges)
+
+    def spring_layout(**kwargs):
+        pos = nx.spring_layout(G, k=0.5, **kwargs)
+        return np.array([pos[name] for name in names])
+
+    # on a warm start only the new artists move, so the rest of the picture stays put
+    pos = cached_layout(names, sources, targets, weights, "spring", 
+                        lambda: spring_layout(iterations=LAYOUT_ITERATIONS), 
+                        lambda initial, new: spring_layout(pos=dict(zip(names, initial)), 
+                                                           fixed=[name for name, is_new in zip(names, new) if not is_new] or None, 
+                                                           iterations=REFINE_ITERATIONS))
+    pos = dict(zip(names, pos))
+    plt.figure(figsize=FIGURE_SIZE)
+    nx.draw_networkx_nodes(G, pos, node_size=NODE_SIZE, node_color="lightblue"),
+    nx.draw_networkx_edges(G, pos, edgelist=edge_list, edge_color=edge_colors_list, width=edge_widths, alpha=0.7)
+    nx.draw_networkx_labels(G, pos, font_size=FONT_SIZE)
+    plt.title("Artist Relationships Network\n(Blue: Similarity, Red: Tour, Green: Festival, Purple: Tag)")
+    plt.axis("off")
+
+    from matplotlib.lines import Line2D
+    legend_elements = [Line2D([0], [0], color="blue", lw=2, label="Similarity"),
+                       Line2D([0], [0], color="red", lw=2, label="Tour"),
+                       Line2D([0], [0], color="green", lw=2, label="Festival"),
+                       Line2D([0], [0], color="purple", lw=2, label="Tag")]
+    plt.legend(handles=legend_elements, loc="upper right")
+    plt.show()
\ No newline at end of file